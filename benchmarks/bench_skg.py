@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import skg_main.skg_mgrs.connector_mgr as conn
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from benchmarks.synthetic_skg import Synthetic_Skg, make_automaton
+from skg_main.skg_mgrs.skg_reader import Skg_Reader
+from skg_main.skg_mgrs.skg_writer import Skg_Writer
+from skg_main.skg_model.schema import Activity
+from skg_main.skg_model.semantics import EntityForest
+
+
+# Benchmarks Skg_Reader and Skg_Writer against synthetic SKGs loaded into the Neo4j instance configured for
+# skg_main (a local, disposable instance is recommended). Synthetic nodes are removed at the end of the run.
+
+
+def measure(name: str, fn: Callable, repeat: int, items: Callable = None):
+    # Runs fn repeat times; items, if given, maps fn's result to the number of items it produced.
+    latencies: List[float] = []
+    n_items = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - t0)
+        if items is not None:
+            n_items = items(result)
+    return summarize(name, latencies, n_items)
+
+
+def summarize(name: str, latencies: List[float], n_items: int = None):
+    repeat = len(latencies)
+    latencies = sorted(latencies)
+    stats = {'name': name, 'repeat': repeat, 'median_s': statistics.median(latencies), 'min_s': latencies[0],
+             'max_s': latencies[-1], 'p95_s': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]}
+    if n_items is not None:
+        stats['items'] = n_items
+        stats['items_per_s'] = n_items / stats['median_s'] if stats['median_s'] > 0 else None
+    print('{:<40} median {:>9.4f} s  p95 {:>9.4f} s{}'.format(
+        name, stats['median_s'], stats['p95_s'],
+        '  ({} items, {:.0f}/s)'.format(n_items, stats['items_per_s'] or 0) if n_items is not None else ''))
+    return stats
+
+
+def bench_reader(reader: Skg_Reader, skg: Synthetic_Skg, repeat: int):
+    results: List[Dict] = []
+    start_t, end_t = skg.window(0.5)
+
+    results.append(measure('get_events', reader.get_events, repeat, len))
+    results.append(measure('get_events_by_date (50% window)', lambda: reader.get_events_by_date(start_t, end_t),
+                           repeat, len))
+    results.append(measure('iter_events_by_date (50% window)',
+                           lambda: sum(1 for _ in reader.iter_events_by_date(start_t, end_t, 1000)), repeat, int))
+    results.append(measure('get_event_table_by_date (50% window)',
+                           lambda: reader.get_event_table_by_date(start_t, end_t, 1000), repeat, len))
+
+    en_ids = [skg.entity_id(e) for e in skg.items[:50]]
+    results.append(measure('get_events_by_entity (x{})'.format(len(en_ids)),
+                           lambda: [reader.get_events_by_entity(en_id) for en_id in en_ids], repeat,
+                           lambda r: sum(len(evts) for evts in r)))
+    results.append(measure('get_events_by_entities (x{})'.format(len(en_ids)),
+                           lambda: reader.get_events_by_entities(en_ids, start_t, end_t), repeat, len))
+
+    if 'entity_to_entity' in reader.SCHEMA:
+        labels_hierarchy = reader.get_entity_labels_hierarchy()
+        results.append(measure('get_entity_forest', lambda: reader.get_entity_forest(labels_hierarchy), repeat,
+                               lambda f: len(f.trees)))
+        roots = [skg.entity_id(e) for e in skg.roots[:10]]
+        for batched in [False, True]:
+            results.append(measure('get_entity_tree (x{}, batched={})'.format(len(roots), batched),
+                                   lambda: [reader.get_entity_tree(r, EntityForest([]), reverse=False,
+                                                                   batched=batched) for r in roots], repeat))
+    return results
+
+
+def bench_writer(writer: Skg_Writer, skg: Synthetic_Skg, n_locations: int, n_edges: int, repeat: int):
+    results: List[Dict] = []
+    automaton = make_automaton('SKG_BENCHMARK', n_locations, n_edges, skg.activities)
+    features = n_locations + n_edges
+
+    def store():
+        writer.write_automaton_batched(automaton, 'item', 0, 1)
+
+    def delete():
+        writer.cleanup(automaton.name, 'item', 0, 1)
+
+    store_times, delete_times = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        store()
+        store_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        delete()
+        delete_times.append(time.perf_counter() - t0)
+    results.append(summarize('write_automaton_batched', store_times, features))
+    results.append(summarize('cleanup (one automaton)', delete_times, features))
+
+    store()
+    changed = make_automaton('SKG_BENCHMARK', n_locations, n_edges, skg.activities, seed=1)
+    results.append(measure('update_automaton', lambda: writer.update_automaton(pov='item', start=0, end=1,
+                                                                               automaton=changed), 1))
+
+    links = [(edge, Activity(edge.label, {})) for edge in changed.edges]
+    results.append(measure('create_semantic_links (x{})'.format(len(links)),
+                           lambda: writer.create_semantic_links(changed, 'BENCHMARK_LINK', links, 'item', 0, 1),
+                           repeat, lambda created: created))
+    delete()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks Skg_Reader and Skg_Writer on a synthetic SKG.')
+    parser.add_argument('--schema', default=None, help='Schema name (defaults to the configured one).')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--entities', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--activities', type=int, default=10)
+    parser.add_argument('--locations', type=int, default=20)
+    parser.add_argument('--edges', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='Keeps the synthetic SKG in the database.')
+    parser.add_argument('--output', help='JSON file results are written to.')
+    args = parser.parse_args()
+
+    if args.schema is not None:
+        os.environ['NEO4J_SCHEMA'] = args.schema
+    schema_name = skg_registry.get_schema_name()
+    if args.schema is not None and schema_name != args.schema:
+        raise ValueError('--schema requires the env_var Neo4j instance configuration.')
+
+    manager = conn.get_manager()
+    skg = Synthetic_Skg(skg_registry.get_schema(schema_name), args.events, args.entities, args.depth,
+                        args.activities, args.seed)
+    t0 = time.perf_counter()
+    skg.load(manager)
+    load_time = time.perf_counter() - t0
+    print('Loaded {} nodes, {} relationships in {:.2f} s.'.format(len(skg.nodes), len(skg.rels), load_time))
+
+    try:
+        results = bench_reader(Skg_Reader(manager), skg, args.repeat)
+        results += bench_writer(Skg_Writer(manager), skg, args.locations, args.edges, args.repeat)
+    finally:
+        if not args.keep:
+            skg.drop(manager)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'schema': schema_name, 'params': vars(args), 'python': sys.version,
+                       'platform': platform.platform(), 'load_s': load_time, 'nodes': len(skg.nodes),
+                       'relationships': len(skg.rels), 'pool': manager.stats(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List
+
+# Public entry points of skg_main, whose import cost is tracked.
+ENTRY_POINTS = ['skg_main.autotwin_connector', 'skg_main.skg_mgrs.connector_mgr', 'skg_main.skg_mgrs.skg_reader',
+                'skg_main.skg_mgrs.skg_writer', 'skg_main.skg_mgrs.skg_async_reader', 'skg_main.skg_mgrs.skg_cache']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str, module: str):
+    # Lines look like 'import time: self [us] | cumulative | <indent>package', with nested imports listed
+    # (more indented) right before the package importing them: only the block ending with module is kept,
+    # leaving out what the interpreter imports at startup.
+    block: List = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        block.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+        if depth == 0:
+            if name.strip() == module:
+                return {n: {'depth': d, 'self': s, 'cumulative': c} for n, d, s, c in block}
+            block = []
+    raise RuntimeError('{} not found in -X importtime output.'.format(module))
+
+
+def measure(module: str):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('Importing {} failed:\n{}'.format(module, result.stderr.splitlines()[-1]))
+    return parse_importtime(result.stderr, module)
+
+
+def benchmark(module: str, repeat: int, top: int):
+    runs = [measure(module) for _ in range(repeat)]
+    totals = [run[module]['cumulative'] for run in runs]
+    # Heaviest top-level packages outside skg_main (by cumulative time) in the last run.
+    heaviest: List = sorted(((name, t['cumulative']) for name, t in runs[-1].items()
+                             if '.' not in name and name != 'skg_main'), key=lambda x: x[1], reverse=True)[:top]
+    return {'module': module, 'median_us': statistics.median(totals), 'min_us': min(totals),
+            'max_us': max(totals), 'modules_imported': len(runs[-1]),
+            'heaviest': [{'module': name, 'cumulative_us': us} for name, us in heaviest]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures import time of skg_main entry points '
+                                                 'with python -X importtime.')
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--output', help='JSON file results are written to.')
+    args = parser.parse_args()
+
+    results = [benchmark(m, args.repeat, args.top) for m in args.modules]
+    for r in results:
+        print('{:<40} {:>8.1f} ms  ({} modules; heaviest: {})'.format(
+            r['module'], r['median_us'] / 1000, r['modules_imported'],
+            ', '.join('{} {:.1f} ms'.format(h['module'], h['cumulative_us'] / 1000) for h in r['heaviest'][:3])))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
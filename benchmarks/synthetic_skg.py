@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from skg_main.skg_model.automata import Automaton, Edge, Location
+
+# Property set on every generated node (and indexed), so that synthetic data can be told apart from, and removed
+# without touching, anything else stored in the database used for benchmarks. No extra label is used, since
+# labels show up in the entity labels hierarchy.
+BENCHMARK_ID = 'benchmarkId'
+
+
+class Synthetic_Skg:
+    # Synthetic SKG following one of the shipped schemas: n_activities activities, n_entities items
+    # (plus the parents of depth hierarchy levels, if the schema has entity_to_entity relationships),
+    # n_entities // 10 resources, and n_events events, each related to one item and one resource.
+    def __init__(self, schema: Dict, n_events: int = 10000, n_entities: int = 100, depth: int = 2,
+                 n_activities: int = 10, seed: int = 0):
+        self.schema = schema
+        self.rnd = random.Random(seed)
+        # (labels, properties) per node, by benchmark id.
+        self.nodes: Dict[str, Tuple[List[str], Dict]] = {}
+        # (source, type, target) benchmark ids.
+        self.rels: List[Tuple[str, str, str]] = []
+
+        self.activities = ['act_{}'.format(i) for i in range(n_activities)]
+        for act in self.activities:
+            self.add_node('A_' + act, [schema['activity']] + schema['activity_labels'],
+                          {prop: act for prop in schema['activity_properties']['id']})
+
+        self.items = [self.add_entity(schema['item'], 'I{}'.format(i)) for i in range(n_entities)]
+        self.resources = [self.add_entity(schema['resource'], 'R{}'.format(i))
+                          for i in range(max(1, n_entities // 10))]
+
+        # Hierarchy levels above items, labelled as the entity labels following the item one (if any).
+        self.roots = list(self.items)
+        if 'entity_to_entity' in schema:
+            labels = schema['entity_labels']
+            level_labels = labels[labels.index(schema['item']) + 1:] if schema['item'] in labels else []
+            children = self.items
+            for level in range(depth):
+                label = level_labels[level] if level < len(level_labels) else 'Level{}'.format(level + 1)
+                parents = [self.add_entity(label, 'L{}_{}'.format(level + 1, i))
+                           for i in range(max(1, len(children) // 4))]
+                for i, child in enumerate(children):
+                    self.rels.append((child, schema['entity_to_entity'], parents[i % len(parents)]))
+                children = parents
+            self.roots = children
+
+        dates = 'date' in schema['event_properties']
+        self.start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.events: List[str] = []
+        for i in range(n_events):
+            t = self.start + timedelta(seconds=i)
+            props = {schema['event_properties']['act']: self.rnd.choice(self.activities),
+                     schema['event_properties']['timestamp']: t if dates else float(i)}
+            event = self.add_node('EV{}'.format(i), [schema['event']] + schema['event_labels'], props)
+            self.rels.append((event, schema['event_to_item'], self.rnd.choice(self.items)))
+            self.rels.append((event, schema['event_to_resource'], self.rnd.choice(self.resources)))
+            self.events.append(event)
+        self.end = self.start + timedelta(seconds=n_events)
+
+    def add_node(self, b_id: str, labels: List[str], props: Dict):
+        props[BENCHMARK_ID] = b_id
+        self.nodes[b_id] = ([l for label in labels for l in label.split(':')], props)
+        return b_id
+
+    def add_entity(self, label: str, e_id: str):
+        return self.add_node(e_id, [self.schema['entity'], label], {self.schema['entity_properties']['id']: e_id})
+
+    def entity_id(self, b_id: str):
+        return self.nodes[b_id][1][self.schema['entity_properties']['id']]
+
+    def window(self, fraction: float):
+        # Bounds of a window covering the given fraction of the events, in the schema's timestamp units.
+        n = len(self.events)
+        lo, hi = int(n * (1 - fraction) / 2), int(n * (1 + fraction) / 2)
+        if 'date' in self.schema['event_properties']:
+            from skg_main.skg_model.schema import Timestamp
+
+            to_ts = lambda s: Timestamp.parse_ts(self.start + timedelta(seconds=s))
+            return to_ts(lo), to_ts(hi)
+        return float(lo), float(hi)
+
+    def base_labels(self):
+        return [self.schema['event'], self.schema['entity'], self.schema['activity']]
+
+    def load(self, driver, batch_size: int = 5000):
+        with driver.session() as session:
+            for label in self.base_labels():
+                session.run("CREATE INDEX skg_benchmark_{0} IF NOT EXISTS FOR (n:{0}) ON (n.{1})".format(
+                    label, BENCHMARK_ID)).consume()
+            session.run("CALL db.awaitIndexes(300)").consume()
+
+            by_labels: Dict[Tuple[str, ...], List[Dict]] = {}
+            for labels, props in self.nodes.values():
+                by_labels.setdefault(tuple(labels), []).append(props)
+            for labels, props in by_labels.items():
+                query = "UNWIND $nodes AS n CREATE (x:{}) SET x = n".format(':'.join(labels))
+                for i in range(0, len(props), batch_size):
+                    session.run(query, nodes=props[i:i + batch_size]).consume()
+
+            # Nodes are matched by their base label (the first one) and benchmark id.
+            by_type: Dict[Tuple[str, str, str], List[Dict]] = {}
+            for source, rel_type, target in self.rels:
+                key = (self.nodes[source][0][0], rel_type, self.nodes[target][0][0])
+                by_type.setdefault(key, []).append({'s': source, 't': target})
+            for (source_label, rel_type, target_label), rels in by_type.items():
+                query = "UNWIND $rels AS r MATCH (s:{} {{{}: r.s}}) MATCH (t:{} {{{}: r.t}}) " \
+                        "CREATE (s) -[:{}]-> (t)".format(source_label, BENCHMARK_ID, target_label, BENCHMARK_ID,
+                                                         rel_type)
+                for i in range(0, len(rels), batch_size):
+                    session.run(query, rels=rels[i:i + batch_size]).consume()
+
+    def drop(self, driver, batch_size: int = 10000):
+        with driver.session() as session:
+            for label in self.base_labels():
+                session.run("MATCH (x:{}) WHERE x.{} IS NOT NULL "
+                            "CALL {{ WITH x DETACH DELETE x }} IN TRANSACTIONS OF {} ROWS".format(
+                                label, BENCHMARK_ID, int(batch_size))).consume()
+                session.run("DROP INDEX skg_benchmark_{} IF EXISTS".format(label)).consume()
+
+
+def make_automaton(name: str, n_locations: int, n_edges: int, activities: List[str], seed: int = 0):
+    rnd = random.Random(seed)
+    automaton = Automaton(name)
+    automaton.locations = [Location('q{}'.format(i)) for i in range(n_locations)]
+    automaton.edges = [Edge(rnd.choice(activities), rnd.choice(automaton.locations), rnd.choice(automaton.locations))
+                       for _ in range(n_edges)]
+    return automaton
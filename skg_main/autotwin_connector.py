@@ -1,22 +1,83 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
 import skg_main.skg_mgrs.connector_mgr as conn
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_logger.logger import Logger
 from skg_main.skg_mgrs.skg_writer import Skg_Writer
+from skg_main.skg_model.automata import Automaton
+
+LOGGER = Logger('Autotwin Connector')
 
 
+# Both calls share the process-wide connection pool, which is closed at exit.
 def store_automaton(name: str, pov: str = None, start=None, end=None, path=None):
-    driver = conn.get_driver()
+    writer = Skg_Writer(conn.get_manager())
+    automaton, new_automaton_id = writer.write_automaton(name, pov, start, end, path, batched=True)
 
-    writer = Skg_Writer(driver)
-    automaton, new_automaton_id = writer.write_automaton(name, pov, start, end, path)
+    return automaton, new_automaton_id
 
-    driver.close()
 
-    return automaton, new_automaton_id
+def parse_automaton(name: str, path=None):
+    # Runs in the worker processes of store_automata: DOT parsing is CPU-bound.
+    return Skg_Writer(None).load_automaton(name, path)
 
 
-def delete_automaton(name: str = None, pov: str = None, start=None, end=None):
-    driver = conn.get_driver()
+def store_automata(automata: List[Dict], parse_workers: int = None, write_workers: int = None):
+    # Stores many automata, each given as a dict with the arguments of store_automaton
+    # (name, and optionally pov, start, end, path). DOT files are parsed in a process pool, and automata
+    # are written concurrently, each in its own transaction, over the shared connection pool.
+    # Returns the parsed automata and their element ids (None if storing them failed), in input order,
+    # and the exception raised for each failed automaton, by input index.
+    config = skg_registry.get_config()['AUTOMATA TO SKG']
+    if parse_workers is None:
+        parse_workers = int(config['store.parse_workers'])
+    if write_workers is None:
+        write_workers = int(config['store.write_workers'])
 
-    writer = Skg_Writer(driver)
-    writer.cleanup(name, pov, start, end)
+    parsed: List[Automaton] = [None] * len(automata)
+    ids: List[str] = [None] * len(automata)
+    failures: Dict[int, Exception] = {}
+
+    if parse_workers > 1 and len(automata) > 1:
+        with ProcessPoolExecutor(max_workers=min(parse_workers, len(automata))) as pool:
+            futures = [pool.submit(parse_automaton, a['name'], a.get('path')) for a in automata]
+            for i, future in enumerate(futures):
+                try:
+                    parsed[i] = future.result()
+                except Exception as e:
+                    failures[i] = e
+    else:
+        for i, a in enumerate(automata):
+            try:
+                parsed[i] = parse_automaton(a['name'], a.get('path'))
+            except Exception as e:
+                failures[i] = e
+
+    writer = Skg_Writer(conn.get_manager())
+    to_write: List[Tuple[int, Dict]] = [(i, a) for i, a in enumerate(automata) if i not in failures]
+    with ThreadPoolExecutor(max_workers=max(1, write_workers)) as pool:
+        futures = {i: pool.submit(writer.write_automaton_batched, parsed[i], a.get('pov'), a.get('start'),
+                                  a.get('end')) for i, a in to_write}
+        for i, future in futures.items():
+            try:
+                ids[i] = future.result()
+            except Exception as e:
+                failures[i] = e
 
-    driver.close()
+    for i in sorted(failures):
+        LOGGER.error('Could not store {}: {}', automata[i]['name'], failures[i])
+    LOGGER.info('Stored {} out of {} automata.', len(automata) - len(failures), len(automata))
+
+    return parsed, ids, dict(sorted(failures.items()))
+
+
+def update_automaton(name: str, pov: str = None, start=None, end=None, path=None):
+    # Only the locations and edges that changed are written, semantic links of the others are kept.
+    writer = Skg_Writer(conn.get_manager())
+    return writer.update_automaton(name, pov, start, end, path)
+
+
+def delete_automaton(name: str = None, pov: str = None, start=None, end=None):
+    writer = Skg_Writer(conn.get_manager())
+    writer.cleanup(name, pov, start, end)
@@ -1,11 +1,15 @@
-import configparser
+import atexit
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import sys
+import threading
 from datetime import datetime
 from enum import Enum
 
-config = configparser.ConfigParser()
-config.read(os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main/resources/config/config.ini')
-config.sections()
+import skg_main.skg_mgrs.skg_registry as skg_registry
 
 
 class LogLevel(Enum):
@@ -44,12 +48,30 @@ class LogLevel(Enum):
         else:
             return None
 
+    def to_logging(self):
+        return LOGGING_LEVELS[self]
 
-# INIT LOGGING LEVEL BASED ON CONFIG FILE
-if 'log.level' in config['GENERAL SETTINGS']:
-    MIN_LOG_LEVEL: LogLevel = LogLevel.parse_str(config['GENERAL SETTINGS']['log.level'])
-else:
-    MIN_LOG_LEVEL: LogLevel = LogLevel.WARNING
+
+# Loggers are children of the 'skg_main' logger of the logging module; MSG messages are always shown.
+LOGGER_NAME = 'skg_main'
+MSG_LEVEL = 99
+LOGGING_LEVELS = {LogLevel.DEBUG: logging.DEBUG, LogLevel.INFO: logging.INFO, LogLevel.WARNING: logging.WARNING,
+                  LogLevel.ERROR: logging.ERROR, LogLevel.MSG: MSG_LEVEL}
+logging.addLevelName(MSG_LEVEL, 'MSG')
+
+# INIT LOGGING LEVEL BASED ON CONFIG FILE (on first use)
+MIN_LOG_LEVEL: LogLevel = None
+
+
+def get_min_log_level():
+    global MIN_LOG_LEVEL
+    if MIN_LOG_LEVEL is None:
+        config = skg_registry.get_config()
+        if 'log.level' in config['GENERAL SETTINGS']:
+            MIN_LOG_LEVEL = LogLevel.parse_str(config['GENERAL SETTINGS']['log.level'])
+        else:
+            MIN_LOG_LEVEL = LogLevel.WARNING
+    return MIN_LOG_LEVEL
 
 
 #
@@ -66,35 +88,164 @@ class bcolor:
     UNDERLINE = '\033[4m'
 
 
+class Message:
+    # Message formatted with str.format only when (and where) a handler needs it.
+    def __init__(self, msg: str, args: tuple):
+        self.msg = msg
+        self.args = args
+
+    def __str__(self):
+        if len(self.args) == 0:
+            return str(self.msg)
+        return self.msg.format(*self.args)
+
+
+def speaker(record: logging.LogRecord):
+    return record.name[len(LOGGER_NAME) + 1:] if record.name.startswith(LOGGER_NAME + '.') else record.name
+
+
+class Console_Formatter(logging.Formatter):
+    COLORS = {logging.INFO: bcolor.OKBLUE, logging.WARNING: bcolor.WARNING, logging.ERROR: bcolor.FAIL}
+
+    def format(self, record: logging.LogRecord):
+        # As before, MSG lines are tagged with the configured minimum level.
+        level = str(get_min_log_level()) if record.levelno == MSG_LEVEL else record.levelname
+        line = Logger.MSG_STR.format(level, datetime.fromtimestamp(record.created), speaker(record),
+                                     record.getMessage())
+        if record.levelno in self.COLORS:
+            return self.COLORS[record.levelno] + line + bcolor.ENDC
+        return line
+
+
+class JsonLines_Formatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        return json.dumps({'level': record.levelname, 'time': datetime.fromtimestamp(record.created).isoformat(),
+                           'speaker': speaker(record), 'message': record.getMessage()})
+
+
+class Lazy_QueueHandler(logging.handlers.QueueHandler):
+    # Unlike QueueHandler, leaves formatting to the listener thread: messages and their arguments
+    # must therefore not be mutated after being logged.
+    def prepare(self, record: logging.LogRecord):
+        return record
+
+
+# Handlers of the 'skg_main' logger, set up on first use from the [GENERAL SETTINGS] section of config.ini:
+# log.level, log.stdout (colored lines on stdout, default true), log.json.path (JSON lines file, default none)
+# and log.queue (default true: handlers run in a background thread, fed through a queue).
+# Propagation is left as set by the application (enabled by default): records also reach the handlers of parent
+# loggers, e.g., those installed with logging.basicConfig, so applications with their own handlers should set
+# log.stdout = false to avoid printing records twice.
+LOCK = threading.Lock()
+CONFIGURED = False
+HANDLERS: list = []
+LISTENER: logging.handlers.QueueListener = None
+USE_QUEUE = True
+
+
+def configure():
+    global CONFIGURED, LISTENER
+    with LOCK:
+        if CONFIGURED:
+            return
+        settings = skg_registry.get_config()['GENERAL SETTINGS']
+        root = logging.getLogger(LOGGER_NAME)
+        root.setLevel(get_min_log_level().to_logging())
+
+        handlers: list = []
+        if settings.getboolean('log.stdout', fallback=True):
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(Console_Formatter())
+            handlers.append(console)
+        if settings.get('log.json.path', fallback='').strip() != '':
+            json_lines = logging.FileHandler(settings['log.json.path'].strip().format(skg_registry.ROOT))
+            json_lines.setFormatter(JsonLines_Formatter())
+            handlers.append(json_lines)
+
+        if len(handlers) > 0 and USE_QUEUE and settings.getboolean('log.queue', fallback=True):
+            records = queue.SimpleQueue()
+            LISTENER = logging.handlers.QueueListener(records, *handlers)
+            LISTENER.start()
+            HANDLERS.append(Lazy_QueueHandler(records))
+        else:
+            HANDLERS.extend(handlers)
+        for handler in HANDLERS:
+            root.addHandler(handler)
+        CONFIGURED = True
+
+
+def flush():
+    # Waits for queued records to be written, e.g., before printing to stdout directly.
+    with LOCK:
+        if LISTENER is not None:
+            LISTENER.stop()
+            LISTENER.start()
+
+
+def shutdown():
+    global CONFIGURED, LISTENER
+    with LOCK:
+        if LISTENER is not None:
+            LISTENER.stop()
+            LISTENER = None
+        root = logging.getLogger(LOGGER_NAME)
+        for handler in HANDLERS:
+            root.removeHandler(handler)
+            handler.close()
+        HANDLERS.clear()
+        CONFIGURED = False
+
+
+def after_fork():
+    # The listener thread does not survive fork, and workers may exit without running atexit handlers:
+    # child processes write their records synchronously.
+    global CONFIGURED, LISTENER, USE_QUEUE, LOCK
+    LOCK = threading.Lock()
+    LISTENER = None
+    root = logging.getLogger(LOGGER_NAME)
+    for handler in HANDLERS:
+        root.removeHandler(handler)
+    HANDLERS.clear()
+    CONFIGURED = False
+    USE_QUEUE = False
+
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork)
+
+
 class Logger:
     MSG_STR = "[{}] {} [{}]: {}"
 
+    # Messages are str.format templates: arguments are only formatted if the level is enabled,
+    # e.g., LOGGER.debug('Merged {} trees.', n) instead of LOGGER.debug('Merged {} trees.'.format(n)).
     def __init__(self, speaker: str):
         self.speaker = speaker
+        self.logger = logging.getLogger('{}.{}'.format(LOGGER_NAME, speaker))
+
+    def is_enabled(self, level: LogLevel):
+        if not CONFIGURED:
+            configure()
+        return self.logger.isEnabledFor(LOGGING_LEVELS[level])
+
+    def emit(self, level: int, msg: str, args: tuple):
+        if not CONFIGURED:
+            configure()
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, Message(msg, args))
+
+    def log(self, msg: str, *args):
+        self.emit(MSG_LEVEL, msg, args)
+
+    def debug(self, msg: str, *args):
+        self.emit(logging.DEBUG, msg, args)
+
+    def info(self, msg: str, *args):
+        self.emit(logging.INFO, msg, args)
+
+    def warn(self, msg: str, *args):
+        self.emit(logging.WARNING, msg, args)
 
-    def log(self, msg: str):
-        ts = datetime.now()
-        print(self.MSG_STR.format(LogLevel.__str__(MIN_LOG_LEVEL), ts, self.speaker, msg))
-
-    def debug(self, msg: str):
-        if LogLevel.DEBUG.value >= MIN_LOG_LEVEL.value:
-            ts = datetime.now()
-            print(self.MSG_STR.format(LogLevel.__str__(LogLevel.DEBUG), ts, self.speaker, msg))
-
-    def info(self, msg: str):
-        if LogLevel.INFO.value >= MIN_LOG_LEVEL.value:
-            ts = datetime.now()
-            print(bcolor.OKBLUE + self.MSG_STR.format(LogLevel.__str__(LogLevel.INFO), ts, self.speaker,
-                                                      msg) + bcolor.ENDC)
-
-    def warn(self, msg: str):
-        if LogLevel.WARNING.value >= MIN_LOG_LEVEL.value:
-            ts = datetime.now()
-            print(bcolor.WARNING + self.MSG_STR.format(LogLevel.__str__(LogLevel.WARNING), ts, self.speaker,
-                                                       msg) + bcolor.ENDC)
-
-    def error(self, msg: str):
-        if LogLevel.ERROR.value >= MIN_LOG_LEVEL.value:
-            ts = datetime.now()
-            print(bcolor.FAIL + self.MSG_STR.format(LogLevel.__str__(LogLevel.ERROR), ts, self.speaker,
-                                                    msg) + bcolor.ENDC)
+    def error(self, msg: str, *args):
+        self.emit(logging.ERROR, msg, args)
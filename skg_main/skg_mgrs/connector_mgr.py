@@ -1,43 +1,173 @@
-import configparser
+import atexit
 import os
+import threading
+import time
+from typing import Dict, TYPE_CHECKING
 
-from neo4j import GraphDatabase, Driver
-
+import skg_main.skg_mgrs.skg_registry as skg_registry
 from skg_main.skg_logger.logger import Logger
 
+if TYPE_CHECKING:
+    from neo4j import Driver, Session
+
 LOGGER = Logger('DB Connector')
 
-config = configparser.ConfigParser()
-config.read(os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main/resources/config/config.ini')
-config.sections()
-
-NEO4J_CONFIG = config['NEO4J INSTANCE']['instance']
-
-if NEO4J_CONFIG.lower() == 'env_var':
-    DB_URI = os.environ['NEO4J_URI']
-    DB_USER = os.environ['NEO4J_USERNAME']
-    DB_PW = os.environ['NEO4J_PASSWORD']
-else:
-    config.read('{}/resources/config/{}.ini'.format(os.getcwd(), NEO4J_CONFIG))
-    config.sections()
-
-    DB_SCHEME = config['NEO4J SETTINGS']['db.scheme']
-    DB_IP = config['NEO4J SETTINGS']['db.ip']
-    DB_PORT = config['NEO4J SETTINGS']['db.port']
-    DB_USER = config['NEO4J SETTINGS']['db.user']
-    DB_ENCRIPTION = config['NEO4J SETTINGS']['db.encryption']
-    if DB_ENCRIPTION == 'x':
-        DB_URI = '{}://{}:{}'.format(DB_SCHEME, DB_IP, DB_PORT)
+# Connection settings are resolved from config and environment variables on first use, not at import time.
+SETTINGS: Dict = None
+
+
+def get_settings():
+    global SETTINGS
+    if SETTINGS is not None:
+        return SETTINGS
+
+    config = skg_registry.get_config()
+    NEO4J_CONFIG = config['NEO4J INSTANCE']['instance']
+
+    if NEO4J_CONFIG.lower() == 'env_var':
+        DB_URI = os.environ['NEO4J_URI']
+        DB_USER = os.environ['NEO4J_USERNAME']
+        DB_PW = os.environ['NEO4J_PASSWORD']
     else:
-        DB_URI = '{}+{}://{}:{}'.format(DB_SCHEME, DB_ENCRIPTION, DB_IP, DB_PORT)
-    DB_PW = config['NEO4J SETTINGS']['db.password']
+        instance_config = skg_registry.get_instance_config(NEO4J_CONFIG)
+
+        DB_SCHEME = instance_config['NEO4J SETTINGS']['db.scheme']
+        DB_IP = instance_config['NEO4J SETTINGS']['db.ip']
+        DB_PORT = instance_config['NEO4J SETTINGS']['db.port']
+        DB_USER = instance_config['NEO4J SETTINGS']['db.user']
+        DB_ENCRIPTION = instance_config['NEO4J SETTINGS']['db.encryption']
+        if DB_ENCRIPTION == 'x':
+            DB_URI = '{}://{}:{}'.format(DB_SCHEME, DB_IP, DB_PORT)
+        else:
+            DB_URI = '{}+{}://{}:{}'.format(DB_SCHEME, DB_ENCRIPTION, DB_IP, DB_PORT)
+        DB_PW = instance_config['NEO4J SETTINGS']['db.password']
+
+    SETTINGS = {'uri': DB_URI, 'user': DB_USER, 'password': DB_PW,
+                'pool.max_size': int(config['NEO4J POOL']['pool.max_size']),
+                'pool.max_lifetime': float(config['NEO4J POOL']['pool.max_lifetime']),
+                'pool.acquisition_timeout': float(config['NEO4J POOL']['pool.acquisition_timeout'])}
+    return SETTINGS
 
 
 def get_driver():
+    from neo4j import GraphDatabase
+
+    settings = get_settings()
     LOGGER.debug('Setting up connection to NEO4J DB...')
-    driver = GraphDatabase.driver(DB_URI, auth=(DB_USER, DB_PW))
+    driver = GraphDatabase.driver(settings['uri'], auth=(settings['user'], settings['password']))
     return driver
 
 
-def close_connection(driver: Driver):
+def close_connection(driver: 'Driver'):
     driver.close()
+
+
+# Session handed out by ConnectionManager: behaves as a neo4j.Session and keeps the manager's counters updated.
+class ManagedSession:
+    def __init__(self, manager, session: 'Session'):
+        self.manager = manager
+        self.session = session
+        self.opened_at = None
+
+    def __enter__(self):
+        self.session.__enter__()
+        self.opened_at = time.perf_counter()
+        self.manager.on_session_open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.manager.on_session_close(time.perf_counter() - self.opened_at, exc_type is not None)
+        return self.session.__exit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, item):
+        return getattr(self.session, item)
+
+
+# Process-wide owner of a long-lived, pooled driver: connections are reused across calls instead of paying
+# connection setup and authentication every time. Exposes session() as neo4j.Driver does, so it can be passed
+# to Skg_Reader/Skg_Writer in place of a driver.
+class ConnectionManager:
+    def __init__(self, max_pool_size: int = None, max_lifetime: float = None, acquisition_timeout: float = None):
+        # Unspecified pool settings are taken from the [NEO4J POOL] config section when the driver is created.
+        self.max_pool_size = max_pool_size
+        self.max_lifetime = max_lifetime
+        self.acquisition_timeout = acquisition_timeout
+        self.driver: 'Driver' = None
+        self.lock = threading.Lock()
+        self.drivers_created = 0
+        self.sessions_opened = 0
+        self.sessions_active = 0
+        self.sessions_peak = 0
+        self.sessions_failed = 0
+        self.session_time = 0.0
+
+    def get_driver(self):
+        with self.lock:
+            if self.driver is None:
+                from neo4j import GraphDatabase
+
+                settings = get_settings()
+                if self.max_pool_size is None:
+                    self.max_pool_size = settings['pool.max_size']
+                if self.max_lifetime is None:
+                    self.max_lifetime = settings['pool.max_lifetime']
+                if self.acquisition_timeout is None:
+                    self.acquisition_timeout = settings['pool.acquisition_timeout']
+
+                LOGGER.debug('Setting up connection pool to NEO4J DB (max size: {}, max lifetime: {}s)...',
+                             self.max_pool_size, self.max_lifetime)
+                self.driver = GraphDatabase.driver(settings['uri'], auth=(settings['user'], settings['password']),
+                                                   max_connection_pool_size=self.max_pool_size,
+                                                   max_connection_lifetime=self.max_lifetime,
+                                                   connection_acquisition_timeout=self.acquisition_timeout)
+                self.drivers_created += 1
+            return self.driver
+
+    def session(self, **kwargs):
+        return ManagedSession(self, self.get_driver().session(**kwargs))
+
+    def on_session_open(self):
+        with self.lock:
+            self.sessions_opened += 1
+            self.sessions_active += 1
+            self.sessions_peak = max(self.sessions_peak, self.sessions_active)
+
+    def on_session_close(self, duration: float, failed: bool):
+        with self.lock:
+            self.sessions_active -= 1
+            self.session_time += duration
+            if failed:
+                self.sessions_failed += 1
+
+    def stats(self):
+        with self.lock:
+            stats: Dict = {'max_pool_size': self.max_pool_size, 'max_lifetime': self.max_lifetime,
+                           'connected': self.driver is not None, 'drivers_created': self.drivers_created,
+                           'sessions_opened': self.sessions_opened, 'sessions_active': self.sessions_active,
+                           'sessions_peak': self.sessions_peak, 'sessions_failed': self.sessions_failed,
+                           'session_time': self.session_time}
+        return stats
+
+    def close(self):
+        with self.lock:
+            if self.driver is not None:
+                LOGGER.debug('Closing connection pool to NEO4J DB...')
+                self.driver.close()
+                self.driver = None
+
+
+MANAGER: ConnectionManager = None
+MANAGER_LOCK = threading.Lock()
+
+
+def get_manager():
+    global MANAGER
+    with MANAGER_LOCK:
+        if MANAGER is None:
+            MANAGER = ConnectionManager()
+            atexit.register(MANAGER.close)
+        return MANAGER
+
+
+def get_pool_stats():
+    return get_manager().stats()
@@ -0,0 +1,344 @@
+import asyncio
+from typing import Awaitable, Dict, List, Set, Tuple, TYPE_CHECKING
+
+import skg_main.skg_mgrs.skg_instrumentation as skg_instrumentation
+from skg_main.skg_mgrs.skg_reader import Skg_Reader_Base
+from skg_main.skg_model.schema import Event, Entity, Activity, EventCursor
+from skg_main.skg_model.semantics import EntityTree, EntityRelationship, EntityForest
+
+if TYPE_CHECKING:
+    from neo4j import AsyncDriver, AsyncResult
+
+
+async def gather_bounded(coroutines: List[Awaitable], max_concurrency: int = 8):
+    # Runs the coroutines concurrently, with at most max_concurrency of them awaiting at the same time,
+    # and returns their results in the same order.
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(coroutine: Awaitable):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[run(c) for c in coroutines])
+
+
+# Asyncio counterpart of Skg_Reader, built on neo4j.AsyncGraphDatabase: queries and parsing are shared
+# with Skg_Reader (see Skg_Reader_Base), whereas every method that accesses the database is a coroutine
+# (or an async generator). Records are always read from Neo4j: backends are only supported by Skg_Reader.
+class AsyncSkg_Reader(Skg_Reader_Base):
+    def __init__(self, driver: 'AsyncDriver', max_concurrency: int = 8, backend=None):
+        if backend is not None:
+            raise ValueError('AsyncSkg_Reader does not support backends, use Skg_Reader instead.')
+        super().__init__()
+        self.driver = driver
+        self.max_concurrency = max_concurrency
+
+    async def run_query(self, query: str, params: Dict = None, method: str = None):
+        timer = skg_instrumentation.start(method or skg_instrumentation.caller(), query) \
+            if skg_instrumentation.ENABLED else None
+        async with self.driver.session() as session:
+            results: 'AsyncResult' = await session.run(query, params)
+            data = await results.data()
+            if timer is not None:
+                timer.finish(len(data), await results.consume())
+            return data
+
+    def stream_query(self, query: str, params: Dict = None, fetch_size: int = None, method: str = None):
+        # Async generator of records; as in Skg_Reader.stream_query, the calling method is resolved before iterating.
+        if method is None and skg_instrumentation.ENABLED:
+            method = skg_instrumentation.caller()
+        return self.stream_records(query, params, fetch_size, method)
+
+    async def stream_records(self, query: str, params: Dict, fetch_size: int, method: str):
+        timer = skg_instrumentation.start(method, query) if skg_instrumentation.ENABLED else None
+        session_config = {} if fetch_size is None else {'fetch_size': fetch_size}
+        async with self.driver.session(**session_config) as session:
+            results: 'AsyncResult' = await session.run(query, params)
+            records = 0
+            try:
+                async for record in results:
+                    records += 1
+                    yield record.data()
+                if timer is not None:
+                    timer.finish(records, await results.consume())
+            finally:
+                if timer is not None:
+                    timer.finish(records)
+
+    async def stream_events(self, query: str, params: Dict = None, fetch_size: int = None):
+        async for e in self.stream_query(query, params, fetch_size):
+            yield Event.parse_evt(e, self.SCHEMA['event_properties'])
+
+    async def run_events(self, query: str, params: Dict = None):
+        return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in await self.run_query(query, params)]
+
+    # EVENTS
+
+    def iter_events(self, fetch_size: int = None):
+        return self.stream_events(*self.queries.events(), fetch_size=fetch_size)
+
+    async def get_events(self):
+        return await self.run_events(*self.queries.events())
+
+    async def get_unique_events(self):
+        return set([e.activity for e in await self.get_events()])
+
+    def iter_events_by_timestamp(self, start_t: int = None, end_t: int = None, fetch_size: int = None):
+        if start_t is None and end_t is None:
+            return self.iter_events(fetch_size)
+
+        return self.stream_events(*self.queries.events_by_timestamp(start_t, end_t), fetch_size=fetch_size)
+
+    async def get_events_by_timestamp(self, start_t: int = None, end_t: int = None):
+        if start_t is None and end_t is None:
+            return await self.get_events()
+
+        return await self.run_events(*self.queries.events_by_timestamp(start_t, end_t))
+
+    def iter_events_by_date(self, start_t=None, end_t=None, fetch_size: int = None):
+        return self.stream_events(*self.queries.events_in_window(start_t, end_t), fetch_size=fetch_size)
+
+    async def get_events_by_date(self, start_t=None, end_t=None):
+        return await self.run_events(*self.queries.events_in_window(start_t, end_t))
+
+    async def get_events_since(self, cursor: EventCursor = None, limit: int = None):
+        if cursor is None:
+            cursor = EventCursor()
+
+        events: List[Event] = []
+        next_cursor = EventCursor(cursor.timestamp, list(cursor.element_ids))
+        for r in await self.run_query(*self.queries.events_since(cursor.timestamp, cursor.element_ids, limit)):
+            events.append(Event.parse_evt(r, self.SCHEMA['event_properties']))
+            next_cursor.advance(r['e'][self.SCHEMA['event_properties']['timestamp']], r['element_id'])
+        return events, next_cursor
+
+    async def poll_events(self, cursor: EventCursor = None, interval: float = 1.0, limit: int = None,
+                          cursor_path: str = None):
+        if cursor is None and cursor_path is not None:
+            try:
+                cursor = EventCursor.load(cursor_path)
+            except FileNotFoundError:
+                pass
+
+        while True:
+            events, cursor = await self.get_events_since(cursor, limit)
+            if len(events) > 0:
+                if cursor_path is not None:
+                    cursor.save(cursor_path)
+                yield events
+            if limit is None or len(events) < limit:
+                await asyncio.sleep(interval)
+
+    def iter_events_by_entity(self, en_id: str, pov: str = 'item', fetch_size: int = None):
+        return self.stream_events(*self.queries.events_by_entity(en_id, pov), fetch_size=fetch_size)
+
+    async def get_events_by_entity(self, en_id: str, pov: str = 'item'):
+        return await self.run_events(*self.queries.events_by_entity(en_id, pov))
+
+    def iter_events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item',
+                                            fetch_size: int = None):
+        if start_t is None and end_t is None:
+            return self.iter_events_by_entity(en_id, pov, fetch_size)
+
+        return self.stream_events(*self.queries.events_by_entity_and_timestamp(en_id, start_t, end_t, pov),
+                                  fetch_size=fetch_size)
+
+    async def get_events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item'):
+        if start_t is None and end_t is None:
+            return await self.get_events_by_entity(en_id, pov)
+
+        return await self.run_events(*self.queries.events_by_entity_and_timestamp(en_id, start_t, end_t, pov))
+
+    def iter_events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item',
+                                fetch_size: int = None):
+        return self.stream_events(*self.queries.events_by_entities(en_ids, start_t, end_t, pov),
+                                  fetch_size=fetch_size)
+
+    async def get_events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item'):
+        return await self.run_events(*self.queries.events_by_entities(en_ids, start_t, end_t, pov))
+
+    async def get_events_by_entity_tree(self, tree: EntityTree, pov: str = 'item'):
+        return await self.get_events_by_entities([node.entity_id for node in tree.nodes], pov=pov)
+
+    async def get_events_by_entity_tree_and_timestamp(self, tree: EntityTree, start_t, end_t, pov: str = 'item'):
+        return await self.get_events_by_entities([node.entity_id for node in tree.nodes], start_t, end_t, pov)
+
+    async def get_events_by_entity_forest(self, forest: EntityForest, start_t=None, end_t=None,
+                                          pov: str = 'item'):
+        groups = [[node.entity_id for node in tree.nodes] for tree in forest.trees]
+        events: List[List[Event]] = [[] for _ in groups]
+        async for r in self.stream_query(*self.queries.events_by_entity_trees(groups, start_t, end_t, pov)):
+            events[r['tree']].append(Event.parse_evt(r, self.SCHEMA['event_properties']))
+        return events
+
+    async def get_traces(self, pov: str = 'item', start_t=None, end_t=None, fetch_size: int = None):
+        async for r in self.stream_query(*self.queries.traces(pov, start_t, end_t), fetch_size=fetch_size):
+            yield self.parse_trace(r)
+
+    async def get_events_by_entities_concurrently(self, en_ids: List[str], start_t=None, end_t=None,
+                                                  pov: str = 'item', max_concurrency: int = None):
+        # One query per entity, with at most max_concurrency of them running at the same time.
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        events = await gather_bounded([self.get_events_by_entity_and_timestamp(en_id, start_t, end_t, pov)
+                                       for en_id in en_ids], max_concurrency)
+        return {en_id: evts for en_id, evts in zip(en_ids, events)}
+
+    async def get_events_by_entity_trees_concurrently(self, trees: List[EntityTree], start_t=None, end_t=None,
+                                                      pov: str = 'item', max_concurrency: int = None):
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        return await gather_bounded([self.get_events_by_entity_tree_and_timestamp(tree, start_t, end_t, pov)
+                                     for tree in trees], max_concurrency)
+
+    async def get_event_table(self, query: str, params: Dict = None, fetch_size: int = None,
+                              entity_key: str = None):
+        return self.parse_event_table([r async for r in self.stream_query(query, params, fetch_size)], entity_key)
+
+    async def get_event_table_by_date(self, start_t=None, end_t=None, fetch_size: int = None):
+        return await self.get_event_table(*self.queries.events_in_window(start_t, end_t), fetch_size=fetch_size)
+
+    async def get_event_table_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item',
+                                          fetch_size: int = None):
+        return await self.get_event_table(*self.queries.events_by_entities(en_ids, start_t, end_t, pov),
+                                          fetch_size=fetch_size, entity_key='entity_id')
+
+    # ENTITIES
+
+    async def get_entities(self, limit: int = None, random: bool = False):
+        entities = await self.run_query(*self.queries.entities(limit, random))
+        return [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in entities]
+
+    async def get_entity_by_id(self, entity_id: str):
+        entities = self.parse_entities(await self.run_query(*self.queries.entity_by_id(entity_id)))
+        if len(entities) > 0:
+            return entities[0]
+        else:
+            return None
+
+    async def get_entities_by_labels(self, labels: List[str] = None, limit: int = None, random: bool = False,
+                                     start_t=None, end_t=None):
+        if labels is None:
+            return await self.get_entities(limit, random)
+
+        return self.parse_entities(await self.run_query(*self.queries.entities_by_labels(labels, limit, random,
+                                                                                         start_t, end_t)))
+
+    async def get_entity_labels_hierarchy(self):
+        if 'entity_to_entity' not in self.SCHEMA:
+            return [[l] for l in self.SCHEMA['entity_labels']]
+
+        return self.parse_labels_hierarchy(await self.run_query(*self.queries.entity_labels_hierarchy()),
+                                           self.hierarchy_ignore_labels())
+
+    async def get_items(self, labels_hierarchy=None, limit: int = None, random: bool = False, start_t=None,
+                        end_t=None):
+        if labels_hierarchy is None:
+            labels_hierarchy: List[List[str]] = await self.get_entity_labels_hierarchy()
+        if 'item' in self.SCHEMA:
+            labels_seq = [seq for seq in labels_hierarchy if self.SCHEMA['item'] in seq][0]
+            results = await gather_bounded([self.get_entities_by_labels(label.split('-'), limit, random,
+                                                                        start_t, end_t) for label in labels_seq],
+                                           self.max_concurrency)
+            return [e for entities in results for e in entities]
+        else:
+            return await self.get_entities(limit, random)
+
+    async def get_resource_labels_hierarchy(self):
+        if 'resource_to_resource' not in self.SCHEMA:
+            return [[self.SCHEMA['resource']]]
+
+        return self.parse_labels_hierarchy(await self.run_query(*self.queries.resource_labels_hierarchy()))
+
+    async def get_resources(self, labels_hierarchy=None, limit: int = None, random: bool = False):
+        if labels_hierarchy is None:
+            labels_hierarchy: List[List[str]] = await self.get_resource_labels_hierarchy()
+        if 'resource' in self.SCHEMA:
+            unpacked_labels_seq = [[label.split('-') for label in seq if '-' in label] for seq in labels_hierarchy]
+            [labels_hierarchy.extend(labels) for labels in unpacked_labels_seq if len(labels) > 0]
+            labels_seq = [seq for seq in labels_hierarchy if self.SCHEMA['resource'] in seq][0]
+            return await self.get_entities_by_labels(labels_seq, limit, random)
+        else:
+            return await self.get_entities(limit, random)
+
+    async def get_entity_forest(self, labels_hierarchy: List[List[str]]):
+        trees: EntityForest = EntityForest([])
+        labels = [seq[i] for seq in labels_hierarchy for i in range(len(seq) - 1, -1, -1)]
+        # Levels are fetched concurrently, but added to the forest in the same order as Skg_Reader.
+        results = await gather_bounded([self.run_query(*self.queries.entity_forest(label)) for label in labels],
+                                       self.max_concurrency)
+        for records in results:
+            entities: List[Tuple[Entity, Entity]] = self.parse_entity_pairs(records)
+            if len(entities) == 0:
+                continue
+
+            new_rels: List[EntityRelationship] = [EntityRelationship(tup[0], tup[1]) for tup in entities]
+            trees.add_trees([EntityTree([rel]) for rel in new_rels])
+
+        return trees
+
+    async def get_entity_root_tree(self, entity_id: str, trees: EntityForest):
+        root_tree = EntityTree([])
+        entity = await self.get_entity_by_id(entity_id)
+        if entity is None:
+            return trees
+        root_tree.nodes[entity] = []
+        trees.add_trees([root_tree])
+        return trees
+
+    async def get_entity_tree(self, entity_id: str, trees: EntityForest, reverse: bool = False,
+                              batched: bool = False):
+        if 'entity_to_entity' not in self.SCHEMA:
+            return await self.get_entity_root_tree(entity_id, trees)
+
+        if batched:
+            return await self.get_entity_tree_batched(entity_id, trees, reverse)
+
+        entities: List[Tuple[Entity, Entity]] = self.parse_entity_pairs(
+            await self.run_query(*self.queries.entity_tree(entity_id, reverse)))
+        if len(entities) == 0:
+            return await self.get_entity_root_tree(entity_id, trees)
+
+        new_rels: List[EntityRelationship] = [EntityRelationship(tup[0], tup[1]) for tup in entities]
+        trees.add_trees([EntityTree([rel]) for rel in new_rels])
+        children = [e[1].entity_id for e in entities]
+        for child in children:
+            await self.get_entity_tree(child, trees, reverse)
+        return trees
+
+    async def get_entity_tree_batched(self, entity_id: str, trees: EntityForest, reverse: bool = False):
+        arcs: List[EntityRelationship] = []
+        visited: Set[str] = {str(entity_id)}
+        frontier: List[str] = [entity_id]
+        while len(frontier) > 0:
+            frontier = self.expand_tree_level(await self.run_query(*self.queries.entity_tree_level(frontier,
+                                                                                                   reverse)),
+                                              arcs, visited)
+
+        if len(arcs) == 0:
+            return await self.get_entity_root_tree(entity_id, trees)
+
+        trees.add_trees([EntityTree(arcs)])
+        return trees
+
+    # ACTIVITIES AND AUTOMATA
+
+    async def get_activities(self):
+        activities = await self.run_query(*self.queries.activities())
+        return [Activity.parse_act(s, self.SCHEMA['activity_properties']) for s in activities]
+
+    async def get_related_entities(self, entity_from: str = None, entity_to: str = None,
+                                   filter1: str = None, filter2: str = None,
+                                   limit: int = None, random: bool = False):
+        return self.parse_entity_pairs(await self.run_query(*self.queries.related_entities(entity_from, entity_to,
+                                                                                           filter1, filter2,
+                                                                                           limit, random)))
+
+    async def get_invariants(self, automaton_name: str, start: int, end: int, loc_name: str):
+        return self.parse_invariants(await self.run_query(*self.queries.invariants(automaton_name, start, end,
+                                                                                   loc_name)))
+
+    async def get_prob_weights(self, automaton_name: str, start: int, end: int,
+                               sync: str, source_name: str):
+        return self.parse_prob_weights(await self.run_query(*self.queries.prob_weights(automaton_name, start, end,
+                                                                                       sync, source_name)))
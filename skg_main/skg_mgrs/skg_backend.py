@@ -0,0 +1,446 @@
+import operator
+import random as rnd
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Sequence, Tuple, Union, TYPE_CHECKING
+
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_mgrs.skg_snapshot import Skg_Snapshot, is_columnar
+
+if TYPE_CHECKING:
+    from skg_main.skg_mgrs.skg_columnar import Columnar_Snapshot
+
+Record = Dict
+
+COMPARE = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+
+# Source of the records behind Skg_Reader. Methods mirror those of Skg_Queries: each one takes the same
+# arguments and returns the records that the corresponding query returns from Neo4j (keys included),
+# so that Skg_Reader parses them the same way whatever the backend.
+# Without a backend, or for the queries the backend does not support, Skg_Reader runs the queries
+# against its Neo4j driver.
+class Skg_Backend:
+    def supports(self, kind: str):
+        # Backends support the queries whose methods they override.
+        return getattr(type(self), kind, None) is not getattr(Skg_Backend, kind, None)
+
+    def unsupported(self, kind: str):
+        return NotImplementedError('{} does not support {} queries.'.format(type(self).__name__, kind))
+
+    def events(self) -> Iterable[Record]:
+        raise self.unsupported('events')
+
+    def events_in_window(self, start_t=None, end_t=None) -> Iterable[Record]:
+        raise self.unsupported('events_in_window')
+
+    def events_by_timestamp(self, start_t=None, end_t=None) -> Iterable[Record]:
+        raise self.unsupported('events_by_timestamp')
+
+    def events_since(self, timestamp=None, element_ids: List[str] = None, limit: int = None) -> Iterable[Record]:
+        raise self.unsupported('events_since')
+
+    def events_by_entity(self, en_id: str, pov: str = 'item') -> Iterable[Record]:
+        raise self.unsupported('events_by_entity')
+
+    def events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None,
+                                       pov: str = 'item') -> Iterable[Record]:
+        raise self.unsupported('events_by_entity_and_timestamp')
+
+    def events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item') -> Iterable[Record]:
+        raise self.unsupported('events_by_entities')
+
+    def events_by_entity_trees(self, groups: List[List[str]], start_t=None, end_t=None,
+                               pov: str = 'item') -> Iterable[Record]:
+        raise self.unsupported('events_by_entity_trees')
+
+    def traces(self, pov: str = 'item', start_t=None, end_t=None) -> Iterable[Record]:
+        raise self.unsupported('traces')
+
+    def entities(self, limit: int = None, random: bool = False) -> Iterable[Record]:
+        raise self.unsupported('entities')
+
+    def entity_by_id(self, entity_id: str) -> Iterable[Record]:
+        raise self.unsupported('entity_by_id')
+
+    def entities_by_labels(self, labels: List[str], limit: int = None, random: bool = False,
+                           start_t=None, end_t=None) -> Iterable[Record]:
+        raise self.unsupported('entities_by_labels')
+
+    def entity_labels_hierarchy(self) -> Iterable[Record]:
+        raise self.unsupported('entity_labels_hierarchy')
+
+    def resource_labels_hierarchy(self) -> Iterable[Record]:
+        raise self.unsupported('resource_labels_hierarchy')
+
+    def entity_forest(self, label: str) -> Iterable[Record]:
+        raise self.unsupported('entity_forest')
+
+    def entity_tree(self, entity_id: str, reverse: bool = False) -> Iterable[Record]:
+        raise self.unsupported('entity_tree')
+
+    def entity_tree_level(self, entity_ids: List[str], reverse: bool = False) -> Iterable[Record]:
+        raise self.unsupported('entity_tree_level')
+
+    def related_entities(self, entity_from: str = None, entity_to: str = None, filter1: str = None,
+                         filter2: str = None, limit: int = None, random: bool = False) -> Iterable[Record]:
+        raise self.unsupported('related_entities')
+
+    def activities(self) -> Iterable[Record]:
+        raise self.unsupported('activities')
+
+    def invariants(self, automaton_name: str, start: int, end: int, loc_name: str) -> Iterable[Record]:
+        raise self.unsupported('invariants')
+
+    def prob_weights(self, automaton_name: str, start: int, end: int, sync: str,
+                     source_name: str) -> Iterable[Record]:
+        raise self.unsupported('prob_weights')
+
+
+# In-memory backend answering the reader queries from a Skg_Snapshot, e.g., to run many experiments on a frozen
+# SKG without round trips to Neo4j, or as a local stand-in for a database.
+# Nodes are numbered by their position in the snapshot and indexed by label, entity id and relationship type
+# (in both directions); events are kept sorted by timestamp, so that windows are found by bisection.
+# It can also be given a Columnar_Snapshot (as load does for columnar files): only these indexes are built in
+# memory, nodes and properties are read from the memory-mapped file when queries access them, and events, stored
+# sorted by timestamp, are not re-sorted.
+# Parameters are converted by Skg_Queries exactly as for Neo4j, and filters follow Cypher semantics:
+# comparisons with missing or incomparable values are false, and ORDER BY puts missing values last.
+# Automata queries (invariants, prob_weights) and related_entities are not supported: readers with a driver
+# run them against Neo4j.
+class Skg_Memory_Backend(Skg_Backend):
+    def __init__(self, snapshot: Union[Skg_Snapshot, 'Columnar_Snapshot']):
+        self.snapshot = snapshot
+        self.SCHEMA = skg_registry.get_schema(snapshot.schema_name)
+        self.queries = skg_registry.get_queries(snapshot.schema_name)
+
+        self.columnar = None
+        if isinstance(snapshot, Skg_Snapshot):
+            self.element_ids: Sequence[str] = [n[0] for n in snapshot.nodes]
+            self.ids: Sequence[int] = [n[1] for n in snapshot.nodes]
+            self.labels: Sequence[List[str]] = [n[2] for n in snapshot.nodes]
+            self.label_sets: Sequence[set] = [set(labels) for labels in self.labels]
+            self.props: Sequence[Dict] = [n[3] for n in snapshot.nodes]
+
+            self.by_label: Dict[str, List[int]] = {}
+            for i, labels in enumerate(self.labels):
+                for label in labels:
+                    self.by_label.setdefault(label, []).append(i)
+
+            position = {element_id: i for i, element_id in enumerate(self.element_ids)}
+            rels = [(rel_type, position[source], position[target]) for rel_type, source, target
+                    in snapshot.relationships if source in position and target in position]
+        else:
+            self.columnar = snapshot
+            self.element_ids, self.ids, self.labels, self.label_sets, self.props = snapshot.node_views()
+            self.by_label = snapshot.label_index()
+            rels = snapshot.relationship_triples()
+
+        # Relationship type -> (source, target) pairs, and node -> neighbours, in each direction.
+        self.rels: Dict[str, List[Tuple[int, int]]] = {}
+        self.outgoing: Dict[str, Dict[int, List[int]]] = {}
+        self.incoming: Dict[str, Dict[int, List[int]]] = {}
+        for rel_type, s, t in rels:
+            self.rels.setdefault(rel_type, []).append((s, t))
+            self.outgoing.setdefault(rel_type, {}).setdefault(s, []).append(t)
+            self.incoming.setdefault(rel_type, {}).setdefault(t, []).append(s)
+
+        # Entities by id property (or node id): numeric ids are found by equal ints and floats, as in Cypher.
+        self.by_entity_id: Dict[object, List[int]] = {}
+        for i in self.nodes_with(self.SCHEMA['entity']):
+            try:
+                self.by_entity_id.setdefault(self.entity_id(i), []).append(i)
+            except TypeError:
+                # Unhashable (list) ids cannot be equal to any id parameter.
+                continue
+
+        # Event timestamp indexes, by property: (sorted values, nodes, nodes without the property).
+        self.sorted_events: Dict[str, Tuple[Sequence, Sequence[int], List[int]]] = {}
+
+    @staticmethod
+    def load(path: str):
+        # Columnar files are memory-mapped rather than converted to a Skg_Snapshot.
+        if is_columnar(path):
+            from skg_main.skg_mgrs.skg_columnar import Columnar_Snapshot
+
+            return Skg_Memory_Backend(Columnar_Snapshot(path))
+        return Skg_Memory_Backend(Skg_Snapshot.load(path))
+
+    # NODES
+
+    def has_labels(self, i: int, label: str):
+        return all(l in self.label_sets[i] for l in label.split(':'))
+
+    def nodes_with(self, label: str):
+        labels = label.split(':')
+        return [i for i in self.by_label.get(labels[0], []) if all(l in self.label_sets[i] for l in labels[1:])]
+
+    def in_version(self, i: int):
+        return 'version' not in self.SCHEMA or self.has_labels(i, self.SCHEMA['version'])
+
+    def entity_id(self, i: int):
+        if self.SCHEMA['entity_properties']['id'] == 'ID':
+            return self.ids[i]
+        return self.value(i, self.SCHEMA['entity_properties']['id'])
+
+    def value(self, i: int, key: str):
+        # Property of a node (None if missing), without building its property dict for columnar snapshots.
+        if self.columnar is not None:
+            return self.columnar.value(i, key)
+        return self.props[i].get(key)
+
+    def entities_matching(self, value):
+        # Entities matched by an id parameter built by Skg_Queries: a list of candidates or a single node id.
+        if value is None:
+            return []
+        values = value if isinstance(value, list) else [value]
+        matched: List[int] = []
+        for v in values:
+            for i in self.by_entity_id.get(v, []):
+                if i not in matched:
+                    matched.append(i)
+        return matched
+
+    def neighbours(self, i: int, rel_type: str, direction: str = None):
+        # direction: 'out', 'in', or None for both (undirected patterns).
+        nodes: List[int] = []
+        if direction in [None, 'out']:
+            nodes.extend(self.outgoing.get(rel_type, {}).get(i, []))
+        if direction in [None, 'in']:
+            nodes.extend(self.incoming.get(rel_type, {}).get(i, []))
+        return nodes
+
+    # FILTERS AND ORDERING
+
+    @staticmethod
+    def compare(value, op: str, bound):
+        if value is None or bound is None:
+            return False
+        try:
+            return COMPARE[op](value, bound)
+        except TypeError:
+            return False
+
+    def in_window(self, i: int, params: Dict, prop: str = None, inclusive: bool = False):
+        if prop is None:
+            prop = self.SCHEMA['event_properties']['timestamp']
+        value = self.value(i, prop)
+        if 'start_t' in params and not self.compare(value, '>=' if inclusive else '>', params['start_t']):
+            return False
+        if 'end_t' in params and not self.compare(value, '<=' if inclusive else '<', params['end_t']):
+            return False
+        return True
+
+    def ordered(self, nodes: List[int], prop: str = None):
+        if prop is None:
+            prop = self.SCHEMA['event_properties']['timestamp']
+        present = [i for i in nodes if self.value(i, prop) is not None]
+        missing = [i for i in nodes if self.value(i, prop) is None]
+        try:
+            present.sort(key=lambda i: self.value(i, prop))
+        except TypeError:
+            pass
+        return present + missing
+
+    def events_sorted_by(self, prop: str):
+        # Events with the property sorted by (value, element id), as in the ORDER BY of events_since.
+        if prop in self.sorted_events:
+            return self.sorted_events[prop]
+        if self.columnar is not None and self.columnar.sorted_by(prop):
+            # Events are the first nodes of the file, already in this order: values are decoded when bisecting.
+            n_events = self.columnar.header['n_events']
+            self.sorted_events[prop] = (self.columnar.event_values(prop), range(n_events), [])
+        else:
+            events = self.nodes_with(self.SCHEMA['event'])
+            present = [i for i in events if self.value(i, prop) is not None]
+            missing = [i for i in events if self.value(i, prop) is None]
+            try:
+                present.sort(key=lambda i: (self.value(i, prop), self.element_ids[i]))
+                values = [self.value(i, prop) for i in present]
+            except TypeError:
+                values = None
+            self.sorted_events[prop] = (values, present, missing)
+        return self.sorted_events[prop]
+
+    def events_in_range(self, params: Dict, prop: str = None):
+        # Events with start_t < prop < end_t (bounds are optional), in prop order.
+        if prop is None:
+            prop = self.SCHEMA['event_properties']['timestamp']
+        values, nodes, _ = self.events_sorted_by(prop)
+        if values is not None:
+            try:
+                lo = bisect_right(values, params['start_t']) if 'start_t' in params else 0
+                hi = bisect_left(values, params['end_t']) if 'end_t' in params else len(values)
+                return nodes[lo:hi]
+            except TypeError:
+                pass
+        return [i for i in nodes if self.in_window(i, params, prop)]
+
+    def limited(self, records: List[Record], limit: int = None, random: bool = False):
+        if random:
+            rnd.shuffle(records)
+        if limit is not None:
+            records = records[:limit]
+        return records
+
+    # EVENTS
+
+    def event_records(self, nodes: Iterable[int]):
+        return [{'e': self.props[i]} for i in nodes]
+
+    def events(self):
+        return self.event_records(self.nodes_with(self.SCHEMA['event']))
+
+    def events_by_timestamp(self, start_t=None, end_t=None):
+        params = self.queries.events_by_timestamp(start_t, end_t)[1]
+        return self.event_records(i for i in self.events_in_range(params) if self.in_version(i))
+
+    def events_by_date(self, start_t=None, end_t=None):
+        params = self.queries.events_by_date(start_t, end_t)[1]
+        return self.event_records(i for i in self.events_in_range(params, self.SCHEMA['event_properties']['date'])
+                                  if self.in_version(i))
+
+    def events_in_window(self, start_t=None, end_t=None):
+        if start_t is None and end_t is None:
+            return self.events()
+        elif 'date' not in self.SCHEMA['event_properties']:
+            return self.events_by_timestamp(start_t, end_t)
+        else:
+            return self.events_by_date(start_t, end_t)
+
+    def events_since(self, timestamp=None, element_ids: List[str] = None, limit: int = None):
+        params = self.queries.events_since(timestamp, element_ids, limit)[1]
+        values, nodes, _ = self.events_sorted_by(self.SCHEMA['event_properties']['timestamp'])
+        if 'timestamp' in params and values is not None:
+            nodes = nodes[bisect_left(values, params['timestamp']):]
+
+        skipped = set(params.get('element_ids', []))
+        records: List[Record] = []
+        for i in nodes:
+            if limit is not None and len(records) >= limit:
+                break
+            if 'timestamp' in params and (
+                    not self.compare(self.value(i, self.SCHEMA['event_properties']['timestamp']), '>=',
+                                     params['timestamp']) or self.element_ids[i] in skipped):
+                continue
+            if self.in_version(i):
+                records.append({'e': self.props[i], 'element_id': self.element_ids[i]})
+        return records
+
+    def entity_events(self, entity: int, pov: str = 'item'):
+        # Events related to the entity, in either direction, once per relationship.
+        return [i for i in self.neighbours(entity, self.queries.event_to_entity(pov))
+                if self.has_labels(i, self.SCHEMA['event'])]
+
+    def events_by_entity(self, en_id: str, pov: str = 'item'):
+        params = self.queries.events_by_entity(en_id, pov)[1]
+        return self.event_records(self.ordered([i for y in self.entities_matching(params['en_id'])
+                                                for i in self.entity_events(y, pov) if self.in_version(i)]))
+
+    def events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item'):
+        params = self.queries.events_by_entity_and_timestamp(en_id, start_t, end_t, pov)[1]
+        return self.event_records(self.ordered([i for y in self.entities_matching(params['en_id'])
+                                                for i in self.entity_events(y, pov) if self.in_window(i, params)]))
+
+    def events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item'):
+        params = self.queries.events_by_entities(en_ids, start_t, end_t, pov)[1]
+        rows = [(i, y) for y in self.entities_matching(params['en_ids']) for i in self.entity_events(y, pov)
+                if self.in_window(i, params) and self.in_version(i)]
+        order = {i: n for n, i in enumerate(self.ordered(list(dict.fromkeys(i for i, _ in rows))))}
+        rows.sort(key=lambda row: order[row[0]])
+        return [{'e': self.props[i], 'entity_id': self.entity_id(y)} for i, y in rows]
+
+    def events_by_entity_trees(self, groups: List[List[str]], start_t=None, end_t=None, pov: str = 'item'):
+        params = self.queries.events_by_entity_trees(groups, start_t, end_t, pov)[1]
+        records: List[Record] = []
+        for tree in range(len(groups)):
+            nodes = [i for ent in params['entities'] if ent['tree'] == tree
+                     for y in self.entities_matching(ent['id']) for i in self.entity_events(y, pov)
+                     if self.in_window(i, params) and self.in_version(i)]
+            records.extend({'tree': tree, 'e': self.props[i]} for i in self.ordered(nodes))
+        return records
+
+    def traces(self, pov: str = 'item', start_t=None, end_t=None):
+        params = self.queries.traces(pov, start_t, end_t)[1]
+        traces: List[Tuple[object, List[int]]] = []
+        for y in self.nodes_with(self.SCHEMA['entity']):
+            events = [i for i in self.entity_events(y, pov) if self.in_window(i, params) and self.in_version(i)]
+            if len(events) > 0:
+                traces.append((self.entity_id(y), self.ordered(events)))
+        try:
+            traces.sort(key=lambda trace: (trace[0] is None, trace[0]))
+        except TypeError:
+            # Ids of different types: Neo4j orders them by type, then by value.
+            traces.sort(key=lambda trace: (trace[0] is None, type(trace[0]).__name__, str(trace[0])))
+        return [{'entity_id': entity_id, 'events': [self.props[i] for i in events]} for entity_id, events in traces]
+
+    # ENTITIES
+
+    def entities(self, limit: int = None, random: bool = False):
+        return self.limited([{'e': self.props[i]} for i in self.nodes_with(self.SCHEMA['entity'])], limit, random)
+
+    def entity_by_id(self, entity_id: str):
+        params = self.queries.entity_by_id(entity_id)[1]
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            return [{'e': self.props[i]} for i in self.entities_matching(params['entity_id'])]
+        return [{'e': self.props[i], 'ID(e)': self.ids[i]} for i in self.entities_matching(params['entity_id'])]
+
+    def entities_by_labels(self, labels: List[str], limit: int = None, random: bool = False,
+                           start_t=None, end_t=None):
+        params = self.queries.entities_by_labels(labels, limit, random, start_t, end_t)[1]
+        entities = [i for i in self.nodes_with(self.SCHEMA['entity'])
+                    if all(self.has_labels(i, l) for l in labels) and self.in_version(i)]
+
+        if start_t is None and end_t is None:
+            rows = entities
+        else:
+            # One row per event acting on the entity, as for the MATCH in Neo4j.
+            inclusive = 'date' not in self.SCHEMA['event_properties']
+            rows = [i for i in entities for ev in self.neighbours(i, self.SCHEMA['event_to_item'], 'in')
+                    if self.has_labels(ev, self.SCHEMA['event']) and self.in_window(ev, params, inclusive=inclusive)]
+        return self.limited([{'ID(e)': self.ids[i], 'e': self.props[i]} for i in rows], limit, random)
+
+    def related(self, label: str, rel_type: str):
+        return [(s, t) for s, t in self.rels.get(rel_type, [])
+                if self.has_labels(s, label) and self.has_labels(t, label)]
+
+    def entity_rels(self):
+        return self.related(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'])
+
+    def entity_labels_hierarchy(self):
+        return [{'labels(e1)': self.labels[s], 'labels(e2)': self.labels[t]} for s, t in self.entity_rels()
+                if self.in_version(s)]
+
+    def resource_labels_hierarchy(self):
+        return [{'labels(e1)': self.labels[s], 'labels(e2)': self.labels[t]}
+                for s, t in self.related(self.SCHEMA['resource'], self.SCHEMA['resource_to_resource'])]
+
+    def entity_forest(self, label: str):
+        return [{'e1': self.props[s], 'e2': self.props[t]} for s, t in self.entity_rels()
+                if all(self.has_labels(t, l) for l in label.split('-'))]
+
+    def tree_level(self, parents: List[int], reverse: bool = False):
+        # (e1, e2) pairs with e1 -> e2 (e1 <- e2 if reverse) and e2 among the parents.
+        rows: List[Tuple[int, int]] = []
+        for t in parents:
+            for s in self.neighbours(t, self.SCHEMA['entity_to_entity'], 'out' if reverse else 'in'):
+                if self.has_labels(s, self.SCHEMA['entity']) and self.in_version(s):
+                    rows.append((s, t))
+        return rows
+
+    def entity_tree(self, entity_id: str, reverse: bool = False):
+        params = self.queries.entity_tree(entity_id, reverse)[1]
+        return [{'e1': self.props[s], 'e2': self.props[t]}
+                for s, t in self.tree_level(self.entities_matching(params['entity_id']), reverse)]
+
+    def entity_tree_level(self, entity_ids: List[str], reverse: bool = False):
+        params = self.queries.entity_tree_level(entity_ids, reverse)[1]
+        rows = self.tree_level(self.entities_matching(params['entity_ids']), reverse)
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            return [{'e1': self.props[s], 'e2': self.props[t]} for s, t in rows]
+        return [{'e1': self.props[s], 'e2': self.props[t], 'ID(e1)': self.ids[s], 'ID(e2)': self.ids[t]}
+                for s, t in rows]
+
+    # ACTIVITIES
+
+    def activities(self):
+        return [{'s': self.props[i]} for i in self.nodes_with(self.SCHEMA['activity']) if self.in_version(i)]
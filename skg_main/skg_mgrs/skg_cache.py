@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Callable, Dict, List
+
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_logger.logger import Logger
+from skg_main.skg_mgrs.skg_reader import Skg_Reader
+from skg_main.skg_model.schema import Event, Timestamp
+
+LOGGER = Logger('SKG Cache')
+
+
+# Opt-in, on-disk cache of extracted event windows, placed in front of a Skg_Reader.
+# Entries are keyed by schema name, query kind, entity and window start; each entry stores the events
+# fetched so far and the window end they are complete for. When a requested window extends past it,
+# only events after the last cached timestamp (the watermark) are fetched from the database.
+class Skg_Cache:
+    def __init__(self, reader: Skg_Reader, path: str = None, max_size: int = None):
+        self.reader = reader
+
+        if path is None:
+            path = skg_registry.get_config()['SKG CACHE']['cache.path'].format(skg_registry.ROOT)
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+        if max_size is None:
+            max_size = int(skg_registry.get_config()['SKG CACHE']['cache.max_size'])
+        self.max_size = max_size
+
+    def to_key(self, t):
+        # Window bounds and event timestamps are compared as epoch milliseconds for schemas with dates.
+        if isinstance(t, Timestamp):
+            return t.to_epoch_millis()
+        return t
+
+    def event_key(self, e: Event):
+        if 'date' in self.reader.SCHEMA['event_properties']:
+            return Timestamp.epoch_millis(e.timestamp)
+        return e.timestamp
+
+    def watermark(self, e: Event):
+        # The stored timestamp itself (a DateTime for schemas with dates, offset included), not its
+        # Timestamp, which drops the UTC offset and would be read as UTC.
+        return e.timestamp
+
+    def get_file(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl')
+
+    def load(self, key):
+        file = self.get_file(key)
+        try:
+            with open(file, 'rb') as f:
+                entry = pickle.load(f)
+            # Entries are evicted in least-recently-used order, based on their modification time.
+            os.utime(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+            # Truncated or corrupt entries are fetched again (and overwritten).
+            LOGGER.warn('Ignoring unreadable cache entry {}: {}', file, e)
+            return None
+        return entry
+
+    def store(self, key, entry: Dict):
+        # Each writer uses its own temporary file: concurrent runs refreshing the same entry do not interleave,
+        # and the last one to finish wins.
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp', delete=False) as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self.get_file(key))
+        self.evict()
+
+    def evict(self):
+        # Other processes may evict or replace entries concurrently: files that disappear are skipped.
+        files = []
+        for f in os.scandir(self.path):
+            if f.name.endswith('.pkl'):
+                try:
+                    files.append((f, f.stat()))
+                except FileNotFoundError:
+                    continue
+        total_size = sum(stat.st_size for _, stat in files)
+        for f, stat in sorted(files, key=lambda file: file[1].st_mtime):
+            if total_size <= self.max_size:
+                break
+            total_size -= stat.st_size
+            try:
+                os.remove(f.path)
+                LOGGER.debug('Evicted {} from cache.', f.name)
+            except FileNotFoundError:
+                continue
+
+    def clear(self):
+        for f in os.scandir(self.path):
+            if f.name.endswith('.pkl'):
+                try:
+                    os.remove(f.path)
+                except FileNotFoundError:
+                    continue
+
+    def get_window(self, kind: str, fetch: Callable, start_t=None, end_t=None, entity: str = None, pov: str = None):
+        key = (self.reader.SCHEMA_NAME, kind, entity, pov, self.to_key(start_t))
+        entry = self.load(key)
+
+        if entry is None:
+            LOGGER.debug('Cache miss for {}.', key)
+            entry = {'events': fetch(start_t, end_t), 'end': self.to_key(end_t)}
+            self.store(key, entry)
+        elif end_t is None or entry['end'] is None or self.to_key(end_t) > entry['end']:
+            events: List[Event] = entry['events']
+            if len(events) > 0:
+                last = self.event_key(events[-1])
+                # Only events after the last cached one are added.
+                new_events = [e for e in fetch(self.watermark(events[-1]), end_t) if self.event_key(e) > last]
+            else:
+                new_events = fetch(start_t, end_t)
+            LOGGER.debug('Fetched {} events past the watermark for {}.', len(new_events), key)
+            events.extend(new_events)
+            entry['end'] = self.to_key(end_t)
+            self.store(key, entry)
+
+        if end_t is None:
+            return list(entry['events'])
+        return [e for e in entry['events'] if self.event_key(e) < self.to_key(end_t)]
+
+    def get_events_by_date(self, start_t=None, end_t=None):
+        return self.get_window('events_by_date', self.reader.get_events_by_date, start_t, end_t)
+
+    def get_events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item'):
+        def fetch(start, end):
+            return self.reader.get_events_by_entity_and_timestamp(en_id, start, end, pov)
+
+        return self.get_window('events_by_entity_and_timestamp', fetch, start_t, end_t, str(en_id), pov.lower())
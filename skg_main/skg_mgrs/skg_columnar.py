@@ -0,0 +1,420 @@
+import json
+import pickle
+import struct
+from datetime import timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from neo4j.time import ClockTime, Date, DateTime, UnixEpoch
+
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_logger.logger import Logger
+from skg_main.skg_mgrs.skg_snapshot import COLUMNAR_MAGIC, Skg_Snapshot, Node, Relationship
+from skg_main.skg_model.event_table import EventTable, encode, to_column
+
+LOGGER = Logger('Columnar Snapshot')
+
+VERSION = 1
+ALIGNMENT = 64
+NANOS = 1000000000
+UNIX_EPOCH_ORDINAL = Date(1970, 1, 1).to_ordinal()
+
+
+def align(offset: int):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def wall_clock_nanos(dt: DateTime):
+    seconds = (dt.date().to_ordinal() - UNIX_EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+    return seconds * NANOS + dt.nanosecond
+
+
+def from_wall_clock_nanos(nanos: int, offset: int = None):
+    dt = DateTime.from_clock_time(ClockTime(*divmod(nanos, NANOS)), UnixEpoch)
+    if offset is None:
+        return dt
+    return dt.replace(tzinfo=timezone(timedelta(seconds=offset)))
+
+
+def column_kind(values: List):
+    # values: the non-missing values of a property.
+    if all(isinstance(v, bool) for v in values):
+        return 'bool'
+    elif all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return 'int'
+    elif all(isinstance(v, float) for v in values):
+        return 'float'
+    elif all(isinstance(v, str) for v in values):
+        return 'str'
+    elif all(isinstance(v, DateTime) and v.utcoffset() is not None for v in values):
+        return 'datetime'
+    elif all(isinstance(v, DateTime) and v.utcoffset() is None for v in values):
+        return 'localdatetime'
+    else:
+        return 'object'
+
+
+def encode_strings(strings: List[str]):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray):
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return [raw[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)]
+
+
+class Lazy_Sequence:
+    # Read-only sequence whose items are computed on access, e.g., to bisect a column without decoding all of it.
+    def __init__(self, length: int, item: Callable[[int], object]):
+        self.length = length
+        self.item = item
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.item(j) for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return self.item(i)
+
+
+# Memory-mappable, columnar file format for Skg_Snapshot, to ship SKG slices to machines without database access.
+# Layout: COLUMNAR_MAGIC, the length of a JSON header (uint64, little-endian), the header, then little-endian
+# arrays, each aligned to ALIGNMENT bytes; the header holds, for each array, its dtype, shape and offset from the
+# end of the (aligned) header, as well as the label sets, relationship types and property kinds.
+# Nodes are stored events first, sorted by timestamp, then every other node. Each property is a column over
+# all nodes: numbers and booleans as typed arrays with a presence mask, strings as int32 codes (-1 if missing)
+# into a string table, DateTimes as int64 UTC epoch nanoseconds (wall-clock for local ones) plus the UTC offset
+# in seconds (named timezones are stored as fixed offsets), anything else pickled.
+# Opened files are memory-mapped: columns are zero-copy views, only string tables are decoded (on first use).
+# Skg_Memory_Backend reads them in place (see node_views and value): values are only decoded for the nodes it
+# filters or returns, whereas to_snapshot decodes the whole file.
+class Columnar_Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.buffer[:len(COLUMNAR_MAGIC)]) != COLUMNAR_MAGIC:
+            raise ValueError('{} is not a columnar SKG snapshot.'.format(path))
+
+        header_start = len(COLUMNAR_MAGIC) + 8
+        header_size = struct.unpack('<Q', bytes(self.buffer[len(COLUMNAR_MAGIC):header_start]))[0]
+        self.header = json.loads(bytes(self.buffer[header_start:header_start + header_size]).decode('utf-8'))
+        if self.header['version'] != VERSION:
+            raise ValueError('Unsupported columnar snapshot version {} in {}.'.format(self.header['version'], path))
+        self.data_start = align(header_start + header_size)
+
+        self.schema_name: str = self.header['schema_name']
+        self.SCHEMA = skg_registry.get_schema(self.schema_name)
+        self.string_tables: Dict[str, List[str]] = {}
+        self.columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return self.header['n_nodes']
+
+    # WRITING
+
+    @staticmethod
+    def write(snapshot: Skg_Snapshot, path: str):
+        schema = skg_registry.get_schema(snapshot.schema_name)
+        nodes, events_sorted, n_events = Columnar_Snapshot.order_nodes(snapshot.nodes, schema)
+
+        arrays: Dict[str, np.ndarray] = {}
+        arrays['node.element_id.data'], arrays['node.element_id.offsets'] = encode_strings([n[0] for n in nodes])
+        arrays['node.id'] = np.array([n[1] for n in nodes], dtype=np.int64)
+
+        label_sets: Dict[Tuple[str, ...], int] = {}
+        arrays['node.labels'] = np.array([label_sets.setdefault(tuple(n[2]), len(label_sets)) for n in nodes],
+                                         dtype=np.int32)
+
+        keys: Dict[str, None] = {}
+        for n in nodes:
+            keys.update(dict.fromkeys(n[3]))
+        kinds: Dict[str, str] = {}
+        for key in keys:
+            kinds[key] = Columnar_Snapshot.write_column(arrays, 'prop.' + key, [n[3].get(key) for n in nodes])
+
+        position = {n[0]: i for i, n in enumerate(nodes)}
+        rels = [(rel_type, position[source], position[target]) for rel_type, source, target in snapshot.relationships
+                if source in position and target in position]
+        rel_types: Dict[str, int] = {}
+        arrays['rel.type'] = np.array([rel_types.setdefault(r[0], len(rel_types)) for r in rels], dtype=np.int32)
+        arrays['rel.source'] = np.array([r[1] for r in rels], dtype=np.int64)
+        arrays['rel.target'] = np.array([r[2] for r in rels], dtype=np.int64)
+
+        header = {'version': VERSION, 'schema_name': snapshot.schema_name, 'n_nodes': len(nodes),
+                  'n_events': n_events, 'events_sorted': events_sorted, 'n_relationships': len(rels),
+                  'label_sets': [list(labels) for labels in label_sets], 'rel_types': list(rel_types),
+                  'properties': kinds, 'arrays': {}}
+        offset = 0
+        for name in arrays:
+            arrays[name] = np.ascontiguousarray(arrays[name].astype(arrays[name].dtype.newbyteorder('<'),
+                                                                    copy=False))
+            header['arrays'][name] = {'dtype': arrays[name].dtype.str, 'shape': list(arrays[name].shape),
+                                      'offset': offset}
+            offset = align(offset + arrays[name].nbytes)
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(COLUMNAR_MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            data_start = align(f.tell())
+            for name, array in arrays.items():
+                f.write(b'\0' * (data_start + header['arrays'][name]['offset'] - f.tell()))
+                f.write(array.tobytes())
+        LOGGER.info('Wrote columnar snapshot of {} nodes ({} events) and {} relationships to {}.',
+                    len(nodes), n_events, len(rels), path)
+
+    @staticmethod
+    def order_nodes(nodes: List[Node], schema: Dict):
+        # Events first, sorted by (timestamp, element id) if timestamps are comparable, so that time windows
+        # are contiguous slices of the event columns.
+        event_labels = schema['event'].split(':')
+        ts = schema['event_properties']['timestamp']
+        events = [n for n in nodes if all(l in n[2] for l in event_labels)]
+        others = [n for n in nodes if not all(l in n[2] for l in event_labels)]
+
+        present = [n for n in events if n[3].get(ts) is not None]
+        missing = [n for n in events if n[3].get(ts) is None]
+        try:
+            present.sort(key=lambda n: (n[3][ts], n[0]))
+            events_sorted = len(missing) == 0
+        except TypeError:
+            events_sorted = False
+        return present + missing + others, events_sorted, len(events)
+
+    @staticmethod
+    def write_column(arrays: Dict[str, np.ndarray], name: str, values: List):
+        present = np.array([v is not None for v in values], dtype=bool)
+        kind = column_kind([v for v in values if v is not None])
+        try:
+            if kind == 'bool':
+                arrays[name + '.values'] = np.array([bool(v) for v in values], dtype=bool)
+            elif kind == 'int':
+                arrays[name + '.values'] = np.array([0 if v is None else v for v in values], dtype=np.int64)
+            elif kind == 'float':
+                arrays[name + '.values'] = np.array([0.0 if v is None else v for v in values], dtype=np.float64)
+            elif kind == 'datetime':
+                arrays[name + '.values'] = np.array(
+                    [0 if v is None else wall_clock_nanos(v) - int(v.utcoffset().total_seconds()) * NANOS
+                     for v in values], dtype=np.int64)
+                arrays[name + '.offset'] = np.array(
+                    [0 if v is None else int(v.utcoffset().total_seconds()) for v in values], dtype=np.int32)
+            elif kind == 'localdatetime':
+                arrays[name + '.values'] = np.array([0 if v is None else wall_clock_nanos(v) for v in values],
+                                                    dtype=np.int64)
+        except OverflowError:
+            # Integers or dates out of the int64 range.
+            kind = 'object'
+
+        if kind == 'str':
+            codes: Dict[str, int] = {}
+            arrays[name + '.codes'] = np.array([-1 if v is None else codes.setdefault(v, len(codes))
+                                                for v in values], dtype=np.int32)
+            arrays[name + '.data'], arrays[name + '.offsets'] = encode_strings(list(codes))
+        elif kind == 'object':
+            for suffix in ['.values', '.offset']:
+                arrays.pop(name + suffix, None)
+            arrays[name + '.pickle'] = np.frombuffer(pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL),
+                                                     dtype=np.uint8)
+        else:
+            arrays[name + '.present'] = present
+        return kind
+
+    # READING
+
+    def array(self, name: str):
+        spec = self.header['arrays'][name]
+        dtype = np.dtype(spec['dtype'])
+        start = self.data_start + spec['offset']
+        count = int(np.prod(spec['shape']))
+        return self.buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    def strings(self, name: str):
+        if name not in self.string_tables:
+            self.string_tables[name] = decode_strings(self.array(name + '.data'), self.array(name + '.offsets'))
+        return self.string_tables[name]
+
+    def string(self, name: str, i: int):
+        # Single string of a table, without decoding the others.
+        offsets = self.array(name + '.offsets')
+        return bytes(self.array(name + '.data')[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def element_ids(self):
+        return self.strings('node.element_id')
+
+    def events(self):
+        return slice(0, self.header['n_events'])
+
+    def labels(self, i: int):
+        return self.header['label_sets'][self.array('node.labels')[i]]
+
+    def nodes_with(self, label: str):
+        labels = label.split(':')
+        codes = [c for c, label_set in enumerate(self.header['label_sets']) if all(l in label_set for l in labels)]
+        return np.flatnonzero(np.isin(self.array('node.labels'), codes))
+
+    def relationships(self, rel_type: str = None):
+        # (source, target) node indices, of every relationship or of the given type.
+        sources, targets = self.array('rel.source'), self.array('rel.target')
+        if rel_type is None:
+            return sources, targets
+        if rel_type not in self.header['rel_types']:
+            return sources[:0], targets[:0]
+        mask = self.array('rel.type') == self.header['rel_types'].index(rel_type)
+        return sources[mask], targets[mask]
+
+    def relationship_triples(self):
+        # (type, source, target node indices) of every relationship.
+        rel_types = self.header['rel_types']
+        return [(rel_types[t], s, d) for t, s, d in zip(self.array('rel.type').tolist(),
+                                                        self.array('rel.source').tolist(),
+                                                        self.array('rel.target').tolist())]
+
+    def label_index(self):
+        # Label -> indices of the nodes with that label.
+        label_codes: Dict[str, List[int]] = {}
+        for code, label_set in enumerate(self.header['label_sets']):
+            for label in label_set:
+                label_codes.setdefault(label, []).append(code)
+        return {label: np.flatnonzero(np.isin(self.array('node.labels'), codes)).tolist()
+                for label, codes in label_codes.items()}
+
+    def sorted_by(self, key: str):
+        # Whether events (the first n_events nodes) all have the property and are sorted by (value, element id).
+        return self.header['events_sorted'] and key == self.SCHEMA['event_properties']['timestamp']
+
+    def kind(self, key: str):
+        return self.header['properties'].get(key)
+
+    def column(self, key: str):
+        # (values, presence mask) of a property: values are string codes for 'str' properties (see strings),
+        # UTC epoch nanoseconds for 'datetime' ones, and Python objects for 'object' ones.
+        kind = self.kind(key)
+        name = 'prop.' + key
+        if kind is None:
+            raise ValueError('Property {} is not in snapshot {}.'.format(key, self.path))
+        elif kind == 'str':
+            codes = self.array(name + '.codes')
+            return codes, codes >= 0
+        elif kind == 'object':
+            if key not in self.columns:
+                values = np.empty(len(self), dtype=object)
+                values[:] = pickle.loads(self.array(name + '.pickle').tobytes())
+                self.columns[key] = values, np.array([v is not None for v in values], dtype=bool)
+            return self.columns[key]
+        return self.array(name + '.values'), self.array(name + '.present')
+
+    def value(self, i: int, key: str):
+        # Property value of a single node as a Python object (None where missing), as in values.
+        kind = self.kind(key)
+        if kind is None:
+            return None
+        values, present = self.column(key)
+        if not present[i]:
+            return None
+        elif kind == 'str':
+            return self.strings('prop.' + key)[values[i]]
+        elif kind == 'datetime':
+            offset = int(self.array('prop.{}.offset'.format(key))[i])
+            return from_wall_clock_nanos(int(values[i]) + offset * NANOS, offset)
+        elif kind == 'localdatetime':
+            return from_wall_clock_nanos(int(values[i]))
+        elif kind == 'object':
+            return values[i]
+        return values[i].item()
+
+    def properties(self, i: int):
+        return {key: value for key, value in ((key, self.value(i, key)) for key in self.header['properties'])
+                if value is not None}
+
+    def event_values(self, key: str):
+        # Property values of the events, decoded on access.
+        return Lazy_Sequence(self.header['n_events'], lambda i: self.value(i, key))
+
+    def node_views(self):
+        # Element ids, node ids, labels, label sets and properties of the nodes, decoded on access.
+        label_sets = self.header['label_sets']
+        label_set_sets = [set(labels) for labels in label_sets]
+        codes, node_ids = self.array('node.labels'), self.array('node.id')
+        return (Lazy_Sequence(len(self), lambda i: self.string('node.element_id', i)),
+                Lazy_Sequence(len(self), lambda i: int(node_ids[i])),
+                Lazy_Sequence(len(self), lambda i: list(label_sets[codes[i]])),
+                Lazy_Sequence(len(self), lambda i: label_set_sets[codes[i]]),
+                Lazy_Sequence(len(self), self.properties))
+
+    def values(self, key: str, nodes=slice(None)):
+        # Property values of the given nodes as Python objects (None where missing).
+        kind = self.kind(key)
+        values, present = self.column(key)
+        values, present = values[nodes], present[nodes].tolist()
+        if kind == 'str':
+            table = self.strings('prop.' + key)
+            decoded = [table[c] for c in values.tolist()]
+        elif kind == 'datetime':
+            offsets = self.array('prop.{}.offset'.format(key))[nodes].tolist()
+            decoded = [from_wall_clock_nanos(v + o * NANOS, o) for v, o in zip(values.tolist(), offsets)]
+        elif kind == 'localdatetime':
+            decoded = [from_wall_clock_nanos(v) for v in values.tolist()]
+        else:
+            decoded = values.tolist()
+        return [v if p else None for v, p in zip(decoded, present)]
+
+    def to_snapshot(self):
+        element_ids = self.element_ids()
+        columns = {key: self.values(key) for key in self.header['properties']}
+        label_sets, labels = self.header['label_sets'], self.array('node.labels').tolist()
+        nodes: List[Node] = [(element_ids[i], node_id, list(label_sets[labels[i]]),
+                              {key: column[i] for key, column in columns.items() if column[i] is not None})
+                             for i, node_id in enumerate(self.array('node.id').tolist())]
+
+        rel_types = self.header['rel_types']
+        relationships: List[Relationship] = [
+            (rel_types[t], element_ids[s], element_ids[d]) for t, s, d in
+            zip(self.array('rel.type').tolist(), self.array('rel.source').tolist(), self.array('rel.target').tolist())]
+        return Skg_Snapshot(self.schema_name, nodes, relationships)
+
+    def event_table(self, start_t=None, end_t=None):
+        # EventTable of the events in the window (same conventions as Skg_Reader.get_event_table_by_date):
+        # activity codes, timestamps and typed columns are views on the file if events are sorted.
+        p = self.SCHEMA['event_properties']
+        events = self.events()
+        dates = 'date' in p
+
+        for key in [p['act'], p['timestamp']]:
+            if self.kind(key) is None or not bool(np.all(self.column(key)[1][events])):
+                raise ValueError('Some events in {} have no {} property.'.format(self.path, key))
+
+        if self.kind(p['act']) == 'str':
+            activities, symbols = self.column(p['act'])[0][events], self.strings('prop.' + p['act'])
+        else:
+            activities, symbols = encode(self.values(p['act'], events))
+
+        timestamps = self.column(p['timestamp'])[0][events]
+        if dates:
+            if self.kind(p['timestamp']) not in ['datetime', 'localdatetime']:
+                raise ValueError('Timestamps in {} are not dates.'.format(self.path))
+            timestamps = timestamps // 1000000
+
+        IGNORE_KEYS = [p['act'], p['timestamp']] + ([p['date']] if dates else [])
+        columns: Dict[str, np.ndarray] = {}
+        for key, kind in self.header['properties'].items():
+            if key in IGNORE_KEYS or not bool(np.any(self.column(key)[1][events])):
+                continue
+            if kind in ['bool', 'int', 'float'] and bool(np.all(self.column(key)[1][events])):
+                columns[key] = self.column(key)[0][events]
+            else:
+                columns[key] = to_column(self.values(key, events))
+
+        table = EventTable(activities, symbols, timestamps, columns, dates=dates)
+        if not self.header['events_sorted']:
+            table = table.sort()
+        return table.slice_time(start_t, end_t)
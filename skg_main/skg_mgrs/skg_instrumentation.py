@@ -0,0 +1,225 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List
+
+# Query instrumentation for Skg_Reader and Skg_Writer. While at least one sink is registered (add_sink), every
+# executed query produces a stats dict: calling method, Cypher template (parameters are bound separately),
+# wall time from run to the end of the result, server times from the ResultSummary (ms, None if the result was
+# not fully consumed) and number of records read (None for consumed-only results). The driver does not expose
+# the size in bytes of the results. With no sinks, sessions are returned unwrapped and the only cost is a flag check.
+LOCK = threading.Lock()
+SINKS: List['Sink'] = []
+ENABLED = False
+
+
+def add_sink(sink: 'Sink'):
+    global ENABLED
+    with LOCK:
+        SINKS.append(sink)
+        ENABLED = True
+    return sink
+
+
+def remove_sink(sink: 'Sink'):
+    global ENABLED
+    with LOCK:
+        if sink in SINKS:
+            SINKS.remove(sink)
+        ENABLED = len(SINKS) > 0
+    sink.close()
+
+
+def clear_sinks():
+    for sink in list(SINKS):
+        remove_sink(sink)
+
+
+def caller(depth: int = 2):
+    # Name of the function calling the function that calls caller().
+    return sys._getframe(depth).f_code.co_name
+
+
+def start(method: str, query):
+    if not ENABLED:
+        return None
+    return Query_Timer(method, query)
+
+
+def instrument(runner, method: str = None):
+    # Wraps a session (or transaction) so that its queries are timed; method defaults to the caller of run.
+    if not ENABLED:
+        return runner
+    return Instrumented_Runner(runner, method)
+
+
+class Query_Timer:
+    def __init__(self, method: str, query):
+        self.method = method
+        self.query = getattr(query, 'text', query)
+        self.start = time.perf_counter()
+        self.done = False
+
+    def finish(self, records: int = None, summary=None):
+        if self.done:
+            return
+        self.done = True
+        stats = {'method': self.method, 'query': ' '.join(str(self.query).split()),
+                 'wall_s': time.perf_counter() - self.start, 'records': records,
+                 'server_available_ms': summary.result_available_after if summary is not None else None,
+                 'server_consumed_ms': summary.result_consumed_after if summary is not None else None,
+                 'timestamp': time.time()}
+        for sink in list(SINKS):
+            sink.record(stats)
+
+
+class Instrumented_Result:
+    def __init__(self, result, timer: Query_Timer):
+        self.result = result
+        self.timer = timer
+
+    def __iter__(self):
+        records = 0
+        try:
+            for record in self.result:
+                records += 1
+                yield record
+            self.timer.finish(records, self.result.consume())
+        finally:
+            # Iteration stopped early: the rest of the result is not fetched to get the summary.
+            self.timer.finish(records)
+
+    def data(self, *keys):
+        data = self.result.data(*keys)
+        self.timer.finish(len(data), self.result.consume())
+        return data
+
+    def single(self, strict: bool = False):
+        record = self.result.single(strict=strict)
+        self.timer.finish(0 if record is None else 1, self.result.consume())
+        return record
+
+    def consume(self):
+        summary = self.result.consume()
+        self.timer.finish(None, summary)
+        return summary
+
+    def __getattr__(self, name):
+        return getattr(self.result, name)
+
+
+class Instrumented_Runner:
+    def __init__(self, runner, method: str = None):
+        self.runner = runner
+        self.method = method
+
+    def run(self, query, parameters: Dict = None, **kwargs):
+        timer = Query_Timer(self.method if self.method is not None else caller(), query)
+        return Instrumented_Result(self.runner.run(query, parameters, **kwargs), timer)
+
+    def execute_write(self, transaction_function: Callable, *args, **kwargs):
+        def instrumented(tx, *a, **k):
+            return transaction_function(Instrumented_Runner(tx, self.method), *a, **k)
+
+        return self.runner.execute_write(instrumented, *args, **kwargs)
+
+    def execute_read(self, transaction_function: Callable, *args, **kwargs):
+        def instrumented(tx, *a, **k):
+            return transaction_function(Instrumented_Runner(tx, self.method), *a, **k)
+
+        return self.runner.execute_read(instrumented, *args, **kwargs)
+
+    def __enter__(self):
+        self.runner.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.runner.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.runner, name)
+
+
+# SINKS
+
+class Sink:
+    def record(self, stats: Dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Per-method wall time histograms, with log-spaced buckets (upper bounds in seconds, doubling from min_s),
+# plus totals of records and server times.
+class Histogram_Sink(Sink):
+    def __init__(self, min_s: float = 0.0001, n_buckets: int = 24):
+        self.bounds: List[float] = [min_s * 2 ** i for i in range(n_buckets)]
+        self.histograms: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def record(self, stats: Dict):
+        with self.lock:
+            if stats['method'] not in self.histograms:
+                self.histograms[stats['method']] = {'count': 0, 'total_s': 0.0, 'min_s': None, 'max_s': None,
+                                                    'records': 0, 'server_ms': 0,
+                                                    'buckets': [0] * (len(self.bounds) + 1)}
+            h = self.histograms[stats['method']]
+            h['count'] += 1
+            h['total_s'] += stats['wall_s']
+            h['min_s'] = stats['wall_s'] if h['min_s'] is None else min(h['min_s'], stats['wall_s'])
+            h['max_s'] = stats['wall_s'] if h['max_s'] is None else max(h['max_s'], stats['wall_s'])
+            h['records'] += stats['records'] or 0
+            h['server_ms'] += (stats['server_available_ms'] or 0) + (stats['server_consumed_ms'] or 0)
+            h['buckets'][bisect_left(self.bounds, stats['wall_s'])] += 1
+
+    def percentile(self, method: str, q: float):
+        # Upper bound of the bucket holding the q-th percentile (the maximum for the last bucket).
+        h = self.histograms[method]
+        rank = q * h['count']
+        seen = 0
+        for i, count in enumerate(h['buckets']):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(self.bounds[i], h['max_s']) if i < len(self.bounds) else h['max_s']
+        return h['max_s']
+
+    def summary(self):
+        with self.lock:
+            return {method: {'count': h['count'], 'total_s': h['total_s'], 'mean_s': h['total_s'] / h['count'],
+                             'min_s': h['min_s'], 'max_s': h['max_s'], 'p50_s': self.percentile(method, 0.5),
+                             'p95_s': self.percentile(method, 0.95), 'p99_s': self.percentile(method, 0.99),
+                             'records': h['records'], 'server_ms': h['server_ms']}
+                    for method, h in self.histograms.items()}
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+# Appends one JSON object per query to a file.
+class JsonLines_Sink(Sink):
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def record(self, stats: Dict):
+        line = json.dumps(stats) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Callback_Sink(Sink):
+    def __init__(self, callback: Callable[[Dict], None]):
+        self.callback = callback
+
+    def record(self, stats: Dict):
+        self.callback(stats)
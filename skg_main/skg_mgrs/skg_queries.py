@@ -0,0 +1,487 @@
+from typing import Callable, Dict, List, Tuple
+
+from skg_main.skg_model.schema import Timestamp
+
+Query = Tuple[str, Dict]
+
+
+# Cypher query layer for Skg_Reader: labels, relationship types and property keys are taken from the schema,
+# whereas every value is bound as a driver parameter. Templates only depend on the schema and on which
+# optional parameters are set, hence they are built once and reused, so that Neo4j can cache their plans.
+class Skg_Queries:
+    def __init__(self, schema: Dict, sha_labels: Dict):
+        self.SCHEMA = schema
+        self.SHA_LABELS = sha_labels
+        self.templates: Dict[Tuple, str] = {}
+
+    def get_template(self, key: Tuple, builder: Callable[[], str]):
+        if key not in self.templates:
+            self.templates[key] = builder()
+        return self.templates[key]
+
+    # FILTERS
+
+    def version_filter(self, e_id: str = 'e', prefix: str = 'and'):
+        if 'version' in self.SCHEMA:
+            return ' {} {}:{}'.format(prefix, e_id, self.SCHEMA['version'])
+        return ''
+
+    def version_label(self, e_id: str = 'e'):
+        if 'version' in self.SCHEMA:
+            return '{}:{}'.format(e_id, self.SCHEMA['version'])
+        return ''
+
+    @staticmethod
+    def where(conditions: List[str]):
+        # WHERE clause (with a trailing space) joining the non-empty conditions, or nothing if there are none.
+        conditions = [c for c in conditions if c != '']
+        return 'WHERE {} '.format(' and '.join(conditions)) if len(conditions) > 0 else ''
+
+    def window_filter(self, start_t, end_t, e_id: str = 'e', prop: str = None, inclusive: bool = False):
+        if prop is None:
+            prop = self.SCHEMA['event_properties']['timestamp']
+
+        conditions: List[str] = []
+        if start_t is not None:
+            conditions.append("{}.{} {} $start_t".format(e_id, prop, '>=' if inclusive else '>'))
+        if end_t is not None:
+            conditions.append("{}.{} {} $end_t".format(e_id, prop, '<=' if inclusive else '<'))
+        return ' and '.join(conditions)
+
+    def date_value(self, t):
+        # Dates are converted on the client, so that window predicates are plain (index-backed) comparisons
+        # with a DateTime parameter, which neither require APOC nor prevent plan caching.
+        if isinstance(t, Timestamp):
+            return t.to_datetime()
+        return t
+
+    def window_params(self, start_t, end_t, date: bool = False):
+        params = {}
+        if start_t is not None:
+            params['start_t'] = self.date_value(start_t) if date else start_t
+        if end_t is not None:
+            params['end_t'] = self.date_value(end_t) if date else end_t
+        return params
+
+    def entity_id_filter(self, e_id: str = 'y', value: str = '$en_id', many: bool = False):
+        # FIXME not great, preferable if a property is a primary key for any self.schema.
+        # Ids are not wrapped in toString(), which would prevent index seeks: the id property is instead matched
+        # against every value the id may be stored as (see entity_id_param), and node ids against integers.
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            return "{}.{} IN {}".format(e_id, self.SCHEMA['entity_properties']['id'], value)
+        else:
+            return "ID({}) {} {}".format(e_id, 'IN' if many else '=', value)
+
+    def entity_id_param(self, en_id):
+        if self.SCHEMA['entity_properties']['id'] == 'ID':
+            try:
+                return int(str(en_id))
+            except ValueError:
+                return None
+
+        # Same matches as toString(y.id) = en_id, for ids stored as strings, integers or floats.
+        candidates = [str(en_id)]
+        for parse in [int, float]:
+            try:
+                value = parse(str(en_id))
+            except ValueError:
+                continue
+            if str(value) == str(en_id):
+                candidates.append(value)
+                break
+        return candidates
+
+    def entity_ids_param(self, en_ids: List[str]):
+        if self.SCHEMA['entity_properties']['id'] == 'ID':
+            return [p for p in (self.entity_id_param(en_id) for en_id in en_ids) if p is not None]
+        return [c for en_id in en_ids for c in self.entity_id_param(en_id)]
+
+    def entity_id(self, e_id: str = 'y'):
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            return "{}.{}".format(e_id, self.SCHEMA['entity_properties']['id'])
+        else:
+            return "ID({})".format(e_id)
+
+    def event_to_entity(self, pov: str = 'item'):
+        return self.SCHEMA['event_to_item'] if pov.lower() == 'item' else self.SCHEMA['event_to_resource']
+
+    # EVENTS
+
+    def events(self) -> Query:
+        query = self.get_template(('events',), lambda: "MATCH (e:{}) RETURN e".format(self.SCHEMA['event']))
+        return query, {}
+
+    def events_by_timestamp(self, start_t=None, end_t=None) -> Query:
+        def build():
+            return "MATCH (e:{}) {}RETURN e " \
+                   "ORDER BY e.{}".format(self.SCHEMA['event'],
+                                          self.where([self.window_filter(start_t, end_t), self.version_label()]),
+                                          self.SCHEMA['event_properties']['timestamp'])
+
+        query = self.get_template(('events_by_timestamp', start_t is not None, end_t is not None), build)
+        return query, self.window_params(start_t, end_t)
+
+    def events_by_date(self, start_t=None, end_t=None) -> Query:
+        def build():
+            date = self.SCHEMA['event_properties']['date']
+            return "MATCH (e:{}) {}RETURN e " \
+                   "ORDER BY e.{}".format(self.SCHEMA['event'],
+                                          self.where([self.window_filter(start_t, end_t, prop=date),
+                                                      self.version_label()]), date)
+
+        query = self.get_template(('events_by_date', start_t is not None, end_t is not None), build)
+        return query, self.window_params(start_t, end_t, date=True)
+
+    def events_in_window(self, start_t=None, end_t=None) -> Query:
+        if start_t is None and end_t is None:
+            return self.events()
+        elif 'date' not in self.SCHEMA['event_properties']:
+            return self.events_by_timestamp(start_t, end_t)
+        else:
+            return self.events_by_date(start_t, end_t)
+
+    def events_since(self, timestamp=None, element_ids: List[str] = None, limit: int = None) -> Query:
+        # Events from the timestamp on, but those in element_ids (see EventCursor): ties are not broken on
+        # element ids, which are neither ordered by creation nor unique over time.
+        # Events without a timestamp are never returned, as a cursor cannot point past them.
+        def build():
+            ts = self.SCHEMA['event_properties']['timestamp']
+            if timestamp is not None:
+                conditions = ["e.{} >= $timestamp".format(ts), "NOT elementId(e) IN $element_ids"]
+            else:
+                conditions = ["e.{} IS NOT NULL".format(ts)]
+            conditions.append(self.version_label())
+            query = "MATCH (e:{}) {}RETURN e, elementId(e) AS element_id " \
+                    "ORDER BY e.{}, element_id".format(self.SCHEMA['event'], self.where(conditions), ts)
+            if limit is not None:
+                query += ' LIMIT $limit'
+            return query
+
+        query = self.get_template(('events_since', timestamp is not None, limit is not None), build)
+        params = {}
+        if timestamp is not None:
+            params['timestamp'] = self.date_value(timestamp)
+            params['element_ids'] = element_ids if element_ids is not None else []
+        if limit is not None:
+            params['limit'] = limit
+        return query, params
+
+    def events_by_entity(self, en_id: str, pov: str = 'item') -> Query:
+        arc = self.event_to_entity(pov)
+
+        def build():
+            return "MATCH (e:{}) - [:{}] - (y:{}) WHERE {}{} RETURN e " \
+                   "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], self.entity_id_filter(),
+                                          self.version_filter(), self.SCHEMA['event_properties']['timestamp'])
+
+        query = self.get_template(('events_by_entity', arc), build)
+        return query, {'en_id': self.entity_id_param(en_id)}
+
+    def events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item') -> Query:
+        arc = self.event_to_entity(pov)
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            return "MATCH (e:{}) - [:{}] - (y:{}) {}RETURN e " \
+                   "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'],
+                                          self.where([self.window_filter(start_t, end_t), self.entity_id_filter()]),
+                                          self.SCHEMA['event_properties']['timestamp'])
+
+        query = self.get_template(('events_by_entity_and_timestamp', arc, start_t is not None, end_t is not None),
+                                  build)
+        params = self.window_params(start_t, end_t, date)
+        params['en_id'] = self.entity_id_param(en_id)
+        return query, params
+
+    def events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item') -> Query:
+        arc = self.event_to_entity(pov)
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            query_filter = self.entity_id_filter(value='$en_ids', many=True)
+            if start_t is not None or end_t is not None:
+                query_filter += ' and ' + self.window_filter(start_t, end_t)
+            return "MATCH (e:{}) - [:{}] - (y:{}) WHERE {}{} RETURN e, {} AS entity_id " \
+                   "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], query_filter,
+                                          self.version_filter(), self.entity_id('y'),
+                                          self.SCHEMA['event_properties']['timestamp'])
+
+        query = self.get_template(('events_by_entities', arc, start_t is not None, end_t is not None), build)
+        params = self.window_params(start_t, end_t, date)
+        params['en_ids'] = self.entity_ids_param(en_ids)
+        return query, params
+
+    def events_by_entity_trees(self, groups: List[List[str]], start_t=None, end_t=None,
+                                pov: str = 'item') -> Query:
+        arc = self.event_to_entity(pov)
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            query_filter = self.entity_id_filter(value='ent.id')
+            if start_t is not None or end_t is not None:
+                query_filter += ' and ' + self.window_filter(start_t, end_t)
+            return "UNWIND $entities AS ent " \
+                   "MATCH (e:{}) - [:{}] - (y:{}) WHERE {}{} RETURN ent.tree AS tree, e " \
+                   "ORDER BY tree, e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], query_filter,
+                                                 self.version_filter(), self.SCHEMA['event_properties']['timestamp'])
+
+        query = self.get_template(('events_by_entity_trees', arc, start_t is not None, end_t is not None), build)
+        params = self.window_params(start_t, end_t, date)
+        params['entities'] = [{'tree': i, 'id': self.entity_id_param(en_id)} for i, group in enumerate(groups)
+                              for en_id in group]
+        return query, params
+
+    def traces(self, pov: str = 'item', start_t=None, end_t=None) -> Query:
+        # One record per entity related to events in the window: its id and its time-ordered events.
+        arc = self.event_to_entity(pov)
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            query_filter = self.where([self.window_filter(start_t, end_t), self.version_label()])
+            # Events are sorted before being collected, so that each trace is time-ordered.
+            return "MATCH (e:{}) - [:{}] - (y:{}) {}WITH y, e ORDER BY e.{} " \
+                   "WITH y, collect(e) AS events RETURN {} AS entity_id, events " \
+                   "ORDER BY entity_id".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], query_filter,
+                                               self.SCHEMA['event_properties']['timestamp'], self.entity_id('y'))
+
+        query = self.get_template(('traces', arc, start_t is not None, end_t is not None), build)
+        return query, self.window_params(start_t, end_t, date)
+
+    # ENTITIES
+
+    def entities(self, limit: int = None, random: bool = False) -> Query:
+        def build():
+            query = "MATCH (e:{}) RETURN e".format(self.SCHEMA['entity'])
+            if random:
+                query = query + ', rand() as r ORDER BY r'
+            if limit is not None:
+                query = query + ' LIMIT $limit'
+            return query
+
+        query = self.get_template(('entities', limit is not None, random), build)
+        return query, {} if limit is None else {'limit': limit}
+
+    def entity_by_id(self, entity_id: str) -> Query:
+        def build():
+            if self.SCHEMA['entity_properties']['id'] != 'ID':
+                return "MATCH (e:{}) WHERE {} RETURN e".format(self.SCHEMA['entity'],
+                                                              self.entity_id_filter('e', '$entity_id'))
+            else:
+                return "MATCH (e:{}) WHERE {} RETURN e,ID(e)".format(self.SCHEMA['entity'],
+                                                                    self.entity_id_filter('e', '$entity_id'))
+
+        query = self.get_template(('entity_by_id',), build)
+        return query, {'entity_id': self.entity_id_param(entity_id)}
+
+    def entities_by_labels(self, labels: List[str], limit: int = None, random: bool = False,
+                           start_t=None, end_t=None) -> Query:
+        window = start_t is not None and end_t is not None
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            query_filter = "WHERE " + ' and '.join(["e:{}".format(l) for l in labels])
+            query_filter += self.version_filter()
+
+            if window:
+                query_filter += ' and ' + self.window_filter(start_t, end_t, 'ev', inclusive=not date)
+
+            if start_t is None and end_t is None:
+                query = "MATCH (e:{}) {} RETURN ID(e), e".format(self.SCHEMA['entity'], query_filter)
+            else:
+                query = "MATCH (e:{}) <-[:{}]- (ev:{}) {} RETURN ID(e), e".format(self.SCHEMA['entity'],
+                                                                                  self.SCHEMA['event_to_item'],
+                                                                                  self.SCHEMA['event'],
+                                                                                  query_filter)
+            if random:
+                query = query + ', rand() as r ORDER BY r'
+            if limit is not None:
+                query = query + ' LIMIT $limit'
+            return query
+
+        query = self.get_template(('entities_by_labels', tuple(labels), limit is not None, random,
+                                   start_t is not None, end_t is not None), build)
+        params = self.window_params(start_t, end_t, date) if window else {}
+        if limit is not None:
+            params['limit'] = limit
+        return query, params
+
+    def entity_labels_hierarchy(self) -> Query:
+        def build():
+            return "MATCH (e1:{}) - [:{}] -> (e2:{}){} RETURN labels(e1), " \
+                   "labels(e2)".format(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'], self.SCHEMA['entity'],
+                                       self.version_filter('e1', 'WHERE'))
+
+        return self.get_template(('entity_labels_hierarchy',), build), {}
+
+    def resource_labels_hierarchy(self) -> Query:
+        def build():
+            return "MATCH (e1:{}) - [:{}] -> (e2:{}) RETURN labels(e1), " \
+                   "labels(e2)".format(self.SCHEMA['resource'], self.SCHEMA['resource_to_resource'],
+                                       self.SCHEMA['resource'])
+
+        return self.get_template(('resource_labels_hierarchy',), build), {}
+
+    def entity_forest(self, label: str) -> Query:
+        def build():
+            query_filter = 'e2:{}'.format(label.split('-')[0]) + ''.join(
+                [' and e2:{}'.format(s) for s in label.split('-')[1:]])
+            return "MATCH (e1:{}) - [:{}] -> (e2:{}) WHERE {} RETURN e1, e2".format(self.SCHEMA['entity'],
+                                                                                   self.SCHEMA['entity_to_entity'],
+                                                                                   self.SCHEMA['entity'], query_filter)
+
+        return self.get_template(('entity_forest', label), build), {}
+
+    def entity_tree(self, entity_id: str, reverse: bool = False) -> Query:
+        def build():
+            if reverse:
+                query_tplt = "MATCH (e1:{}) <- [:{}] - (e2:{}) "
+            else:
+                query_tplt = "MATCH (e1:{}) - [:{}] -> (e2:{}) "
+            query = query_tplt.format(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'], self.SCHEMA['entity'])
+            return query + "WHERE {}{} RETURN e1,e2".format(self.entity_id_filter('e2', '$entity_id'),
+                                                            self.version_filter('e1'))
+
+        query = self.get_template(('entity_tree', reverse), build)
+        return query, {'entity_id': self.entity_id_param(entity_id)}
+
+    def entity_tree_level(self, entity_ids: List[str], reverse: bool = False) -> Query:
+        def build():
+            if reverse:
+                query_tplt = "MATCH (e1:{}) <- [:{}] - (e2:{}) "
+            else:
+                query_tplt = "MATCH (e1:{}) - [:{}] -> (e2:{}) "
+            query = query_tplt.format(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'], self.SCHEMA['entity'])
+            query += "WHERE {}{} RETURN e1,e2".format(self.entity_id_filter('e2', '$entity_ids', many=True),
+                                                      self.version_filter('e1'))
+            if self.SCHEMA['entity_properties']['id'] == 'ID':
+                query += ",ID(e1),ID(e2)"
+            return query
+
+        query = self.get_template(('entity_tree_level', reverse), build)
+        return query, {'entity_ids': self.entity_ids_param(entity_ids)}
+
+    def related_entities(self, entity_from: str = None, entity_to: str = None, filter1: str = None,
+                         filter2: str = None, limit: int = None, random: bool = False) -> Query:
+        def build():
+            query = ""
+            if entity_from is None:
+                query += 'MATCH (e1:{})'.format(self.SCHEMA['Entity'])
+            else:
+                query += 'MATCH (e1:{})'.format(entity_from)
+
+            if entity_from is None or entity_to is None:
+                query += ' -> '
+            else:
+                for rels in self.SCHEMA['custom_entity_to_entity']:
+                    if rels['from'] == entity_from and rels['to'] == entity_to:
+                        query += ' -[:{}]-> '.format(rels['name'])
+                        break
+
+            if entity_to is None:
+                query += ' (e2:{}) '.format(self.SCHEMA['Entity'])
+            else:
+                query += ' (e2:{}) '.format(entity_to)
+
+            if filter1 is not None:
+                query += ' WHERE e1.{} = $filter1 '.format(self.SCHEMA['entity_properties']['id'])
+
+            if filter1 is None and filter2 is not None:
+                query += ' WHERE e2.{} = $filter2 '.format(self.SCHEMA['entity_properties']['id'])
+            elif filter1 is not None and filter2 is not None:
+                query += ' and e2.{} = $filter2 '.format(self.SCHEMA['entity_properties']['id'])
+
+            query += 'RETURN e1,e2'
+            if random:
+                query += ',rand() as r ORDER BY r'
+            if limit is not None:
+                query += ' LIMIT $limit'
+            return query
+
+        query = self.get_template(('related_entities', entity_from, entity_to, filter1 is not None,
+                                   filter2 is not None, limit is not None, random), build)
+        params = {'filter1': filter1, 'filter2': filter2, 'limit': limit}
+        return query, {k: v for k, v in params.items() if v is not None}
+
+    # ACTIVITIES
+
+    def activities(self) -> Query:
+        def build():
+            return "MATCH (s:{}){} RETURN s".format(self.SCHEMA['activity'], self.version_filter('s', 'WHERE'))
+
+        return self.get_template(('activities',), build), {}
+
+    # SNAPSHOTS
+
+    def snapshot_labels(self):
+        labels: List[str] = []
+        for key in ['event', 'entity', 'activity', 'resource']:
+            if self.SCHEMA[key] not in labels:
+                labels.append(self.SCHEMA[key])
+        return labels
+
+    def snapshot_rel_types(self):
+        rel_types: List[str] = []
+        for key in ['event_to_item', 'event_to_resource', 'entity_to_entity', 'resource_to_resource']:
+            if key in self.SCHEMA and self.SCHEMA[key] not in rel_types:
+                rel_types.append(self.SCHEMA[key])
+        return rel_types
+
+    def snapshot_nodes(self, start_t=None, end_t=None) -> Query:
+        # Events are restricted to the window, on the same property as events_in_window; other nodes are all kept.
+        date = 'date' in self.SCHEMA['event_properties']
+
+        def build():
+            node_filter = ['n:{}'.format(l) for l in self.snapshot_labels()]
+            if start_t is not None or end_t is not None:
+                prop = self.SCHEMA['event_properties']['date' if date else 'timestamp']
+                node_filter[0] = '({} and {})'.format(node_filter[0], self.window_filter(start_t, end_t, 'n', prop))
+            return "MATCH (n) WHERE {} RETURN elementId(n) AS element_id, ID(n) AS id, labels(n) AS labels, " \
+                   "properties(n) AS props".format(' or '.join(node_filter))
+
+        query = self.get_template(('snapshot_nodes', start_t is not None, end_t is not None), build)
+        return query, self.window_params(start_t, end_t, date)
+
+    def snapshot_relationships(self) -> Query:
+        def build():
+            return "MATCH (s) -[r:{}]-> (t) RETURN type(r) AS type, elementId(s) AS source, " \
+                   "elementId(t) AS target".format('|'.join(self.snapshot_rel_types()))
+
+        return self.get_template(('snapshot_relationships',), build), {}
+
+    # AUTOMATA
+
+    def invariants(self, automaton_name: str, start: int, end: int, loc_name: str) -> Query:
+        def build():
+            query = """MATCH (a:{}) <-[:{}]- (l:{}:{}) -[:MODELS]-> (s:{}) -[:APPLIES]-> (f:{})
+            -[:OUTPUT]-> (e:{}), (g:GraphModel:Instance)
+            WHERE a.{} = $name and a.{} = $start and a.{} = $end and l.{} = $loc_name
+            RETURN l,s,f,e"""
+            return query.format(self.SHA_LABELS["automaton_label"], self.SHA_LABELS["has"],
+                                self.SHA_LABELS["automaton_feature"], self.SHA_LABELS["location_label"],
+                                self.SCHEMA["resource"], self.SCHEMA["res_time_distr"], self.SCHEMA["entity_type"],
+                                self.SHA_LABELS["automaton_attr"]["name"], self.SHA_LABELS["automaton_attr"]["start"],
+                                self.SHA_LABELS["automaton_attr"]["end"], self.SHA_LABELS["location_attr"]["name"])
+
+        query = self.get_template(('invariants',), build)
+        return query, {'name': str(automaton_name), 'start': str(start), 'end': str(end), 'loc_name': str(loc_name)}
+
+    def prob_weights(self, automaton_name: str, start: int, end: int, sync: str, source_name: str) -> Query:
+        def build():
+            query = """MATCH (a:{}) <-[:{}]- (e:{}:{}) -[:LABELED_BY]->
+            (s:MachinePart:Sensor) -[:PART_OF]-> (st:{}), (c:Connection:Ensemble) <-[:BELONGS_TO]-
+            (r:{}) <-[:OCCUPIES]- (et:{}), (st2:{}) <-[:MODELS]- (src:{}:{}) -[:{}]-> (e)
+            WHERE a.{}=$name and a.{}=$start and a.{}=$end and e.{}=$sync and src.{}=$source_name
+            and (st) <-[:DESTINATION]- (c) and (st2) -[:ORIGIN]-> (c)
+            RETURN e, s, st, c, r, et, src, st2"""
+            return query.format(self.SHA_LABELS["automaton_label"], self.SHA_LABELS["has"],
+                                self.SHA_LABELS["automaton_feature"],
+                                self.SHA_LABELS["edge_label"], self.SCHEMA["resource"], self.SCHEMA["route"],
+                                self.SCHEMA["entity_type"], self.SCHEMA["resource"],
+                                self.SHA_LABELS["automaton_feature"], self.SHA_LABELS["location_label"],
+                                self.SHA_LABELS["edge_to_source"], self.SHA_LABELS["automaton_attr"]["name"],
+                                self.SHA_LABELS["automaton_attr"]["start"], self.SHA_LABELS["automaton_attr"]["end"],
+                                self.SHA_LABELS["edge_attr"]["event"], self.SHA_LABELS["location_attr"]["name"])
+
+        query = self.get_template(('prob_weights',), build)
+        return query, {'name': str(automaton_name), 'start': str(start), 'end': str(end), 'sync': str(sync),
+                       'source_name': str(source_name)}
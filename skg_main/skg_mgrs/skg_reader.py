@@ -1,312 +1,279 @@
-import configparser
-import json
 import os
-from typing import List, Tuple
-
-from neo4j import Driver, Result
+import time
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
 
+import skg_main.skg_mgrs.skg_instrumentation as skg_instrumentation
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_mgrs.skg_backend import Skg_Backend
 from skg_main.skg_model.automata import TimeDistr
-from skg_main.skg_model.schema import Event, Entity, Activity
+from skg_main.skg_model.schema import Event, Entity, Activity, EventCursor
 from skg_main.skg_model.semantics import EntityTree, EntityRelationship, EntityForest
 
-config = configparser.ConfigParser()
-config.read(os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main/resources/config/config.ini')
-config.sections()
+if TYPE_CHECKING:
+    from neo4j import Driver, Result
 
 
-class Skg_Reader:
+# Schema, queries and record parsing shared by Skg_Reader and AsyncSkg_Reader,
+# which differ in how the records are fetched.
+class Skg_Reader_Base:
     def setup(self):
-        NEO4J_CONFIG = config['NEO4J INSTANCE']['instance']
+        self.SCHEMA_NAME = skg_registry.get_schema_name()
+        return skg_registry.get_schema(self.SCHEMA_NAME), skg_registry.get_labels()
+
+    def __init__(self):
+        self.SCHEMA, self.SHA_LABELS = self.setup()
+        self.queries = skg_registry.get_queries(self.SCHEMA_NAME)
 
-        if NEO4J_CONFIG.lower() == 'env_var':
-            SCHEMA_NAME = os.environ['NEO4J_SCHEMA']
+    def hierarchy_ignore_labels(self):
+        ignore_labels = [self.SCHEMA['entity'], self.SCHEMA['run']]
+        if 'version' in self.SCHEMA:
+            ignore_labels.append(self.SCHEMA['version'])
+        return ignore_labels
+
+    def parse_entities(self, records: List[Dict]):
+        # FIXME: not great, preferable if a property is a primary key for any self.schema.
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            return [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in records]
         else:
-            SCHEMA_NAME = config['NEO4J SCHEMA']['schema.name']
+            return [Entity.parse_ent(e, self.SCHEMA['entity_properties'], neo4_id=e['ID(e)']) for e in records]
+
+    def parse_entity_pairs(self, records: List[Dict]):
+        return [(Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2'),
+                 Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1')) for r in records]
+
+    def parse_labels_hierarchy(self, records: List[Dict], ignore_labels: List[str] = None):
+        if ignore_labels is None:
+            ignore_labels = []
+        rels: List[Tuple[str, str]] = []
+        for res in records:
+            rels.append(('-'.join([r for r in res['labels(e1)'] if r not in ignore_labels]),
+                         '-'.join([r for r in res['labels(e2)'] if r not in ignore_labels])))
+        return EntityTree.get_labels_hierarchy(set(rels))
+
+    def parse_trace(self, record: Dict):
+        return record['entity_id'], [Event.parse_evt({'e': e}, self.SCHEMA['event_properties'])
+                                     for e in record['events']]
+
+    def parse_event_table(self, records, entity_key: str = None):
+        from skg_main.skg_model.event_table import EventTable
+
+        return EventTable.from_records(records, self.SCHEMA['event_properties'], entity_key)
+
+    def expand_tree_level(self, records: List[Dict], arcs: List[EntityRelationship], visited: Set[str]):
+        # Adds the arcs of a tree level and returns the children that still have to be visited.
+        frontier: List[str] = []
+        for r in records:
+            # FIXME: not great, preferable if a property is a primary key for any self.schema.
+            if self.SCHEMA['entity_properties']['id'] != 'ID':
+                parent = Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2')
+                child = Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1')
+            else:
+                parent = Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2', neo4_id=r['ID(e2)'])
+                child = Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1', neo4_id=r['ID(e1)'])
+            arcs.append(EntityRelationship(parent, child))
+            if str(child.entity_id) not in visited:
+                visited.add(str(child.entity_id))
+                frontier.append(child.entity_id)
+        return frontier
+
+    def parse_invariants(self, records: List[Dict]):
+        entities: List[TimeDistr] = [TimeDistr(r['e']['code'], r['s']['sysId'],
+                                               {a: r['f'][self.SCHEMA['res_time_distr_attr'][a]] for a in
+                                                self.SCHEMA['res_time_distr_attr']}) for r in records]
 
-        SCHEMA_PATH = config['NEO4J SCHEMA']['schema.path'].format(
-            os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main', SCHEMA_NAME)
-        SCHEMA = json.load(open(SCHEMA_PATH))
+        return entities
+
+    def parse_prob_weights(self, records: List[Dict]):
+        entities: List[Tuple[float, TimeDistr]] = [(float(r['r'][self.SCHEMA['route_attr']['probability']]),
+                                                    TimeDistr(r['et']['code'], r['st']['sysId'],
+                                                              {a: r['r'][self.SCHEMA['route_attr'][a]] for a in
+                                                               self.SCHEMA['route_attr']})) for r in records]
 
-        LABELS_PATH = config['AUTOMATA TO SKG']['labels.path'].format(
-            os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main')
-        SHA_LABELS = json.load(open(LABELS_PATH))
+        return entities
 
-        return SCHEMA, SHA_LABELS
 
-    def __init__(self, driver: Driver):
+class Skg_Reader(Skg_Reader_Base):
+    def __init__(self, driver: 'Driver' = None, backend: Skg_Backend = None):
+        # With a backend (e.g., Skg_Memory_Backend), records are read from it instead of the driver.
+        super().__init__()
         self.driver = driver
-        self.SCHEMA, self.SHA_LABELS = self.setup()
+        self.backend = backend
+
+    def session(self, method: str = None, **config):
+        # Sessions are instrumented (see skg_instrumentation) only while query sinks are registered.
+        return skg_instrumentation.instrument(self.driver.session(**config), method)
+
+    def run_query(self, query: str, params: Dict = None, method: str = None):
+        if method is None and skg_instrumentation.ENABLED:
+            method = skg_instrumentation.caller()
+        with self.session(method) as session:
+            results: 'Result' = session.run(query, params)
+            return results.data()
+
+    def stream_query(self, query: str, params: Dict = None, fetch_size: int = None, method: str = None):
+        # Generator of records as they are received from the server, fetching them in batches of fetch_size.
+        # The calling method is resolved here, as generators only run when iterated, possibly elsewhere.
+        if method is None and skg_instrumentation.ENABLED:
+            method = skg_instrumentation.caller()
+        return self.stream_records(query, params, fetch_size, method)
+
+    def stream_records(self, query: str, params: Dict, fetch_size: int, method: str):
+        session_config = {} if fetch_size is None else {'fetch_size': fetch_size}
+        with self.session(method, **session_config) as session:
+            results: 'Result' = session.run(query, params)
+            for record in results:
+                yield record.data()
+
+    def records(self, kind: str, *args, fetch_size: int = None):
+        # Records of the given Skg_Queries query, from the backend if it supports it, otherwise from Neo4j.
+        if self.backend is not None and self.backend.supports(kind):
+            return getattr(self.backend, kind)(*args)
+        if self.driver is None:
+            if self.backend is not None:
+                raise self.backend.unsupported(kind)
+            raise ValueError('Skg_Reader has neither a driver nor a backend.')
+        return self.stream_query(*getattr(self.queries, kind)(*args), fetch_size=fetch_size, method=kind)
+
+    def parse_events(self, records):
+        for e in records:
+            yield Event.parse_evt(e, self.SCHEMA['event_properties'])
+
+    def stream_events(self, query: str, params: Dict = None, fetch_size: int = None):
+        return self.parse_events(self.stream_query(query, params, fetch_size))
+
+    def iter_events(self, fetch_size: int = None):
+        return self.parse_events(self.records('events', fetch_size=fetch_size))
 
     def get_events(self):
-        with self.driver.session() as session:
-            events_recs: Result = session.run("MATCH (e:{}) RETURN e".format(self.SCHEMA['event']))
-            return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in events_recs.data()]
+        return list(self.iter_events())
 
     def get_unique_events(self):
-        all_events = self.get_events()
-        unique_events = [e.activity for e in all_events]
-        return set(unique_events)
+        return set([e.activity for e in self.iter_events()])
 
-    def get_events_by_timestamp(self, start_t: int = None, end_t: int = None):
-        query = ""
+    def iter_events_by_timestamp(self, start_t: int = None, end_t: int = None, fetch_size: int = None):
+        if start_t is None and end_t is None:
+            return self.iter_events(fetch_size)
 
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            version_filter = 'and e:{}'.format(self.SCHEMA['version'])
-
-        if start_t is not None and end_t is None:
-            query = "MATCH (e:{}) WHERE e.{} > {} {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['timestamp'],
-                                           str(start_t), version_filter, self.SCHEMA['event_properties']['timestamp'])
-        elif start_t is None and end_t is not None:
-            query = "MATCH (e:{}) WHERE e.{} < {} {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['timestamp'],
-                                           str(end_t), version_filter, self.SCHEMA['event_properties']['timestamp'])
-        elif start_t is not None and end_t is not None:
-            query = "MATCH (e:{}) where e.{} > {} and e.{} < {} {} return e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['timestamp'],
-                                           str(start_t), self.SCHEMA['event_properties']['timestamp'],
-                                           str(end_t), version_filter, self.SCHEMA['event_properties']['timestamp'])
-        with self.driver.session() as session:
-            events_recs: Result = session.run(query)
-            return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in events_recs.data()]
+        return self.parse_events(self.records('events_by_timestamp', start_t, end_t, fetch_size=fetch_size))
 
-    def get_events_by_date(self, start_t=None, end_t=None):
-        query = ""
+    def get_events_by_timestamp(self, start_t: int = None, end_t: int = None):
+        return list(self.iter_events_by_timestamp(start_t, end_t))
 
-        if 'date' not in self.SCHEMA['event_properties']:
-            return self.get_events_by_timestamp(start_t, end_t)
+    def iter_events_by_date(self, start_t=None, end_t=None, fetch_size: int = None):
+        return self.parse_events(self.records('events_in_window', start_t, end_t, fetch_size=fetch_size))
 
-        if start_t is None and end_t is None:
-            return self.get_events()
+    def get_events_by_date(self, start_t=None, end_t=None):
+        return list(self.iter_events_by_date(start_t, end_t))
 
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            version_filter = 'and e:{}'.format(self.SCHEMA['version'])
+    def get_events_since(self, cursor: EventCursor = None, limit: int = None):
+        # Returns the events following the cursor (at most limit), in timestamp order,
+        # and the cursor pointing to the last of them.
+        if cursor is None:
+            cursor = EventCursor()
 
-        if self.SCHEMA["date_format"] == 'ISO8601':
-            date_format = "apoc.date.fromISO8601(\"{}\")"
-        else:
-            date_format = "apoc.date.parse(\"{}\", \"ms\", \"" + self.SCHEMA["date_format"] + "\")"
-
-        if start_t is not None and end_t is None:
-            query = "MATCH (e:{}) WHERE e.{} > datetime({{epochmillis: {}}}) {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['date'],
-                                           date_format.format(start_t.format(self.SCHEMA["date_format"])),
-                                           version_filter,
-                                           self.SCHEMA['event_properties']['date'])
-        elif start_t is None and end_t is not None:
-            query = "MATCH (e:{}) WHERE e.{} < datetime({{epochmillis: {}}}) {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['date'],
-                                           date_format.format(end_t.format(self.SCHEMA["date_format"])), version_filter,
-                                           self.SCHEMA['event_properties']['date'])
-        elif start_t is not None and end_t is not None:
-            query = "MATCH (e:{}) where e.{} > datetime({{epochmillis: {}}}) and " \
-                    "e.{} < datetime({{epochmillis: {}}}) {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], self.SCHEMA['event_properties']['date'],
-                                           date_format.format(start_t.format(self.SCHEMA["date_format"])),
-                                           self.SCHEMA['event_properties']['date'],
-                                           date_format.format(end_t.format(self.SCHEMA["date_format"])), version_filter,
-                                           self.SCHEMA['event_properties']['date'])
-        with self.driver.session() as session:
-            events_recs: Result = session.run(query)
-            return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in events_recs.data()]
+        events: List[Event] = []
+        next_cursor = EventCursor(cursor.timestamp, list(cursor.element_ids))
+        for r in self.records('events_since', cursor.timestamp, cursor.element_ids, limit):
+            events.append(Event.parse_evt(r, self.SCHEMA['event_properties']))
+            next_cursor.advance(r['e'][self.SCHEMA['event_properties']['timestamp']], r['element_id'])
+        return events, next_cursor
+
+    def poll_events(self, cursor: EventCursor = None, interval: float = 1.0, limit: int = None,
+                    cursor_path: str = None):
+        # Yields batches of new events as they are written to the SKG, persisting the cursor after each batch.
+        if cursor is None and cursor_path is not None and os.path.exists(cursor_path):
+            cursor = EventCursor.load(cursor_path)
+
+        while True:
+            events, cursor = self.get_events_since(cursor, limit)
+            if len(events) > 0:
+                if cursor_path is not None:
+                    cursor.save(cursor_path)
+                yield events
+            if limit is None or len(events) < limit:
+                time.sleep(interval)
+
+    def iter_events_by_entity(self, en_id: str, pov: str = 'item', fetch_size: int = None):
+        return self.parse_events(self.records('events_by_entity', en_id, pov, fetch_size=fetch_size))
 
     def get_events_by_entity(self, en_id: str, pov: str = 'item'):
-        arc = self.SCHEMA['event_to_item'] if pov.lower() == 'item' else self.SCHEMA['event_to_resource']
+        return list(self.iter_events_by_entity(en_id, pov))
 
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            version_filter = 'and e:{}'.format(self.SCHEMA['version'])
+    def iter_events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item',
+                                            fetch_size: int = None):
+        if start_t is None and end_t is None:
+            return self.iter_events_by_entity(en_id, pov, fetch_size)
 
-        # FIXME not great, preferable if a property is a primary key for any self.schema.
-        if self.SCHEMA['entity_properties']['id'] != 'ID':
-            query = "MATCH (e:{}) - [:{}] - (y:{}) WHERE toString(y.{}) = \"{}\" {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'],
-                                           self.SCHEMA['entity_properties']['id'], en_id, version_filter,
-                                           self.SCHEMA['event_properties']['timestamp'])
-        else:
-            query = "MATCH (e:{}) - [:{}] - (y:{}) WHERE toString(ID(y)) = \"{}\" {} RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'],
-                                           en_id, version_filter, self.SCHEMA['event_properties']['timestamp'])
-        with self.driver.session() as session:
-            events_recs: Result = session.run(query)
-            return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in events_recs.data()]
-
-    def get_timestamp_filter(self, start_t, end_t, e_id='e'):
-        if self.SCHEMA["date_format"] == 'ISO8601':
-            date_format = "apoc.date.fromISO8601(\"{}\")"
-        else:
-            date_format = "apoc.date.parse(\"{}\", \"ms\", \"" + self.SCHEMA["date_format"] + "\")"
-
-        if start_t is not None and end_t is None:
-            timestamp_filter = "{}.{} > datetime({{epochmillis: {}}})" \
-                .format(e_id, self.SCHEMA['event_properties']['timestamp'],
-                        date_format.format(start_t.format(self.SCHEMA["date_format"])))
-        elif start_t is None and end_t is not None:
-            timestamp_filter = "{}.{} < datetime({{epochmillis: {}}})" \
-                .format(e_id, self.SCHEMA['event_properties']['timestamp'],
-                        date_format.format(end_t.format(self.SCHEMA["date_format"])))
-        elif start_t is not None and end_t is not None:
-            timestamp_filter = "{}.{} > datetime({{epochmillis: {}}}) and {}.{} < datetime({{epochmillis: {}}})" \
-                .format(e_id, self.SCHEMA['event_properties']['timestamp'],
-                        date_format.format(start_t.format(self.SCHEMA["date_format"])),
-                        e_id, self.SCHEMA['event_properties']['timestamp'],
-                        date_format.format(end_t.format(self.SCHEMA["date_format"])))
-
-        return timestamp_filter
+        return self.parse_events(self.records('events_by_entity_and_timestamp', en_id, start_t, end_t, pov,
+                                              fetch_size=fetch_size))
 
     def get_events_by_entity_and_timestamp(self, en_id: str, start_t=None, end_t=None, pov: str = 'item'):
-        if start_t is None and end_t is None:
-            return self.get_events_by_entity(en_id, pov)
-
-        arc = self.SCHEMA['event_to_item'] if pov.lower() == 'item' else self.SCHEMA['event_to_resource']
-
-        timestamp_filter = ""
-        if 'date' not in self.SCHEMA['event_properties']:
-            if start_t is not None and end_t is None:
-                timestamp_filter = "e.{} > {}".format(self.SCHEMA['event_properties']['timestamp'], str(start_t))
-            elif start_t is None and end_t is not None:
-                timestamp_filter = "e.{} < {}".format(self.SCHEMA['event_properties']['timestamp'], str(end_t))
-            elif start_t is not None and end_t is not None:
-                timestamp_filter = "e.{} > {} and e.{} < {}".format(self.SCHEMA['event_properties']['timestamp'],
-                                                                    str(start_t),
-                                                                    self.SCHEMA['event_properties']['timestamp'],
-                                                                    str(end_t))
-        else:
-            timestamp_filter = self.get_timestamp_filter(start_t, end_t)
+        return list(self.iter_events_by_entity_and_timestamp(en_id, start_t, end_t, pov))
 
-        # FIXME not great, preferable if a property is a primary key for any self.schema.
-        if self.SCHEMA['entity_properties']['id'] != 'ID':
-            query = "MATCH (e:{}) - [:{}] - (y:{}) WHERE {} and toString(y.{}) = \"{}\" RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], timestamp_filter,
-                                           self.SCHEMA['entity_properties']['id'], en_id,
-                                           self.SCHEMA['event_properties']['timestamp'])
-        else:
-            query = "MATCH (e:{}) - [:{}] - (y:{}) WHERE {} and toString(ID(y)) = \"{}\" RETURN e " \
-                    "ORDER BY e.{}".format(self.SCHEMA['event'], arc, self.SCHEMA['entity'], timestamp_filter,
-                                           en_id, self.SCHEMA['event_properties']['timestamp'])
+    def iter_events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item',
+                                fetch_size: int = None):
+        return self.parse_events(self.records('events_by_entities', en_ids, start_t, end_t, pov,
+                                              fetch_size=fetch_size))
 
-        with self.driver.session() as session:
-            events_recs: Result = session.run(query)
-            return [Event.parse_evt(e, self.SCHEMA['event_properties']) for e in events_recs.data()]
+    def get_events_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item'):
+        return list(self.iter_events_by_entities(en_ids, start_t, end_t, pov))
 
     def get_events_by_entity_tree(self, tree: EntityTree, pov: str = 'item'):
-        events: List[Event] = []
-        for node in tree.nodes:
-            events.extend(self.get_events_by_entity(node.entity_id, pov))
-        events.sort(key=lambda e: e.timestamp)
-        return events
+        return self.get_events_by_entities([node.entity_id for node in tree.nodes], pov=pov)
 
     def get_events_by_entity_tree_and_timestamp(self, tree: EntityTree, start_t, end_t, pov: str = 'item'):
-        events: List[Event] = []
-        for node in tree.nodes:
-            events.extend(self.get_events_by_entity_and_timestamp(node.entity_id, start_t, end_t, pov))
-        events.sort(key=lambda e: e.timestamp)
+        return self.get_events_by_entities([node.entity_id for node in tree.nodes], start_t, end_t, pov)
+
+    def get_events_by_entity_forest(self, forest: EntityForest, start_t=None, end_t=None, pov: str = 'item'):
+        # Returns one time-ordered list of events for each tree in the forest, fetched with a single query.
+        groups = [[node.entity_id for node in tree.nodes] for tree in forest.trees]
+        events: List[List[Event]] = [[] for _ in groups]
+        for r in self.records('events_by_entity_trees', groups, start_t, end_t, pov):
+            events[r['tree']].append(Event.parse_evt(r, self.SCHEMA['event_properties']))
         return events
 
-    def get_entities(self, limit: int = None, random: bool = False):
-        query = "MATCH (e:{}) RETURN e".format(self.SCHEMA['entity'])
+    def get_traces(self, pov: str = 'item', start_t=None, end_t=None, fetch_size: int = None):
+        # Yields one (entity id, time-ordered events) trace at a time, for each entity related (as pov)
+        # to events in the window: events are grouped and sorted by Neo4j, with a single query for all entities.
+        for r in self.records('traces', pov, start_t, end_t, fetch_size=fetch_size):
+            yield self.parse_trace(r)
+
+    def get_event_table(self, query: str, params: Dict = None, fetch_size: int = None, entity_key: str = None):
+        # Fills an EventTable directly from the records, without creating an Event object per record.
+        # numpy is only imported when event tables are used.
+        return self.parse_event_table(self.stream_query(query, params, fetch_size), entity_key)
 
-        if random:
-            query = query + ', rand() as r ORDER BY r'
+    def get_event_table_by_date(self, start_t=None, end_t=None, fetch_size: int = None):
+        return self.parse_event_table(self.records('events_in_window', start_t, end_t, fetch_size=fetch_size))
 
-        if limit is not None:
-            query = query + ' LIMIT {}'.format(limit)
+    def get_event_table_by_entities(self, en_ids: List[str], start_t=None, end_t=None, pov: str = 'item',
+                                    fetch_size: int = None):
+        return self.parse_event_table(self.records('events_by_entities', en_ids, start_t, end_t, pov,
+                                                   fetch_size=fetch_size), entity_key='entity_id')
 
-        with self.driver.session() as session:
-            entities = session.run(query)
-            return [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in entities.data()]
+    def get_entities(self, limit: int = None, random: bool = False):
+        entities = self.records('entities', limit, random)
+        return [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in entities]
 
     def get_entity_by_id(self, entity_id: str):
-        if self.SCHEMA['entity_properties']['id'] != 'ID':
-            query = "MATCH (e:{}) WHERE toString(e.{}) = \"{}\" RETURN e".format(self.SCHEMA['entity'],
-                                                                                 self.SCHEMA['entity_properties']['id'],
-                                                                                 entity_id)
+        entities = self.parse_entities(self.records('entity_by_id', entity_id))
+        if len(entities) > 0:
+            return entities[0]
         else:
-            query = "MATCH (e:{}) WHERE toString(ID(e)) = \"{}\" RETURN e,ID(e)".format(self.SCHEMA['entity'],
-                                                                                        entity_id)
-
-        with self.driver.session() as session:
-            results = session.run(query)
-            # FIXME: not great, preferable if a property is a primary key for any self.schema.
-            if self.SCHEMA['entity_properties']['id'] != 'ID':
-                entities = [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in results.data()]
-            else:
-                entities = [Entity.parse_ent(e, self.SCHEMA['entity_properties'], neo4_id=e['ID(e)']) for e in
-                            results.data()]
-            if len(entities) > 0:
-                return entities[0]
-            else:
-                return None
+            return None
 
     def get_entities_by_labels(self, labels: List[str] = None, limit: int = None, random: bool = False,
                                start_t=None, end_t=None):
-
         if labels is None:
             return self.get_entities(limit, random)
-        else:
-            query_filter = "WHERE " + ' and '.join(["e:{}".format(l) for l in labels])
-            if 'version' in self.SCHEMA:
-                query_filter += ' and e:{}'.format(self.SCHEMA['version'])
-
-            if start_t is not None and end_t is not None:
-                if 'date' not in self.SCHEMA['event_properties']:
-                    query_filter += ' and ev.{} >= {} and ev.{} <= {}'.format(
-                        self.SCHEMA['event_properties']['timestamp'],
-                        start_t,
-                        self.SCHEMA['event_properties']['timestamp'],
-                        end_t)
-                else:
-                    query_filter += ' and ' + self.get_timestamp_filter(start_t, end_t, 'ev')
 
-        if start_t is None and end_t is None:
-            query = "MATCH (e:{}) {} RETURN ID(e), e".format(self.SCHEMA['entity'], query_filter)
-        else:
-            query = "MATCH (e:{}) <-[:{}]- (ev:{}) {} RETURN ID(e), e".format(self.SCHEMA['entity'],
-                                                                              self.SCHEMA['event_to_item'],
-                                                                              self.SCHEMA['event'],
-                                                                              query_filter)
-
-        if random:
-            query = query + ', rand() as r ORDER BY r'
-
-        if limit is not None:
-            query = query + ' LIMIT {}'.format(limit)
-
-        with self.driver.session() as session:
-            entities = session.run(query)
-            # FIXME: not great, preferable if a property is a primary key for any self.schema.
-            if self.SCHEMA['entity_properties']['id'] != 'ID':
-                return [Entity.parse_ent(e, self.SCHEMA['entity_properties']) for e in entities.data()]
-            else:
-                return [Entity.parse_ent(e, self.SCHEMA['entity_properties'], neo4_id=e['ID(e)']) for e in
-                        entities.data()]
+        return self.parse_entities(self.records('entities_by_labels', labels, limit, random, start_t, end_t))
 
     def get_entity_labels_hierarchy(self):
         if 'entity_to_entity' not in self.SCHEMA:
             return [[l] for l in self.SCHEMA['entity_labels']]
 
-        IGNORE_LABELS = [self.SCHEMA['entity'], self.SCHEMA['run']]
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            IGNORE_LABELS.append(self.SCHEMA['version'])
-            version_filter += 'WHERE e1:{}'.format(self.SCHEMA['version'])
-
-        query = "MATCH (e1:{}) - [:{}] -> (e2:{}) {} RETURN labels(e1), labels(e2)".format(self.SCHEMA['entity'],
-                                                                                           self.SCHEMA[
-                                                                                               'entity_to_entity'],
-                                                                                           self.SCHEMA['entity'],
-                                                                                           version_filter)
-        with self.driver.session() as session:
-            results = session.run(query)
-
-            rels: List[Tuple[str, str]] = []
-            for res in results.data():
-                rels.append(('-'.join([r for r in res['labels(e1)'] if r not in IGNORE_LABELS]),
-                             '-'.join([r for r in res['labels(e2)'] if r not in IGNORE_LABELS])))
-
-            return EntityTree.get_labels_hierarchy(set(rels))
+        return self.parse_labels_hierarchy(self.records('entity_labels_hierarchy'), self.hierarchy_ignore_labels())
 
     def get_items(self, labels_hierarchy=None, limit: int = None, random: bool = False, start_t=None, end_t=None):
         if labels_hierarchy is None:
@@ -324,19 +291,7 @@ class Skg_Reader:
         if 'resource_to_resource' not in self.SCHEMA:
             return [[self.SCHEMA['resource']]]
 
-        query = "MATCH (e1:{}) - [:{}] -> (e2:{}) RETURN labels(e1), labels(e2)".format(self.SCHEMA['resource'],
-                                                                                        self.SCHEMA[
-                                                                                            'resource_to_resource'],
-                                                                                        self.SCHEMA['resource'])
-        with self.driver.session() as session:
-            results = session.run(query)
-
-            rels: List[Tuple[str, str]] = []
-            for res in results.data():
-                rels.append(('-'.join([r for r in res['labels(e1)']]),
-                             '-'.join([r for r in res['labels(e2)']])))
-
-            return EntityTree.get_labels_hierarchy(set(rels))
+        return self.parse_labels_hierarchy(self.records('resource_labels_hierarchy'))
 
     def get_resources(self, labels_hierarchy=None, limit: int = None, random: bool = False):
         if labels_hierarchy is None:
@@ -352,67 +307,39 @@ class Skg_Reader:
 
     def get_entity_forest(self, labels_hierarchy: List[List[str]]):
         # WARNING: Builds tree for every entity in the KG, likely computational intensive.
-        query_tplt = "MATCH (e1:{}) - [:{}] -> (e2:{}) WHERE {} RETURN e1, e2"
         trees: EntityForest = EntityForest([])
         for seq_i, seq in enumerate(labels_hierarchy):
             for i in range(len(seq) - 1, -1, -1):
-                query_filter = 'e2:{}'.format(seq[i].split('-')[0]) + ''.join(
-                    [' and e2:{}'.format(s) for s in seq[i].split('-')[1:]])
-                query = query_tplt.format(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'], self.SCHEMA['entity'],
-                                          query_filter)
-                with self.driver.session() as session:
-                    results = session.run(query)
-                    entities: List[Tuple[Entity, Entity]] = [
-                        (Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2'),
-                         Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1'))
-                        for r in results.data()]
-                    if len(entities) == 0:
-                        continue
-
-                    new_rels: List[EntityRelationship] = [EntityRelationship(tup[0], tup[1]) for tup in entities]
-                    trees.add_trees([EntityTree([rel]) for rel in new_rels])
+                entities: List[Tuple[Entity, Entity]] = self.parse_entity_pairs(
+                    self.records('entity_forest', seq[i]))
+                if len(entities) == 0:
+                    continue
+
+                new_rels: List[EntityRelationship] = [EntityRelationship(tup[0], tup[1]) for tup in entities]
+                trees.add_trees([EntityTree([rel]) for rel in new_rels])
 
         return trees
 
-    def get_entity_tree(self, entity_id: str, trees: EntityForest, reverse: bool = False):
-        if 'entity_to_entity' not in self.SCHEMA:
-            root_tree = EntityTree([])
-            entity = self.get_entity_by_id(entity_id)
-            if entity is None:
-                return trees
-            root_tree.nodes[entity] = []
-            trees.add_trees([root_tree])
+    def get_entity_root_tree(self, entity_id: str, trees: EntityForest):
+        root_tree = EntityTree([])
+        entity = self.get_entity_by_id(entity_id)
+        if entity is None:
             return trees
+        root_tree.nodes[entity] = []
+        trees.add_trees([root_tree])
+        return trees
 
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            version_filter = ' and e1:{}'.format(self.SCHEMA['version'])
-
-        if reverse:
-            query_tplt = "MATCH (e1:{}) <- [:{}] - (e2:{}) "
-        else:
-            query_tplt = "MATCH (e1:{}) - [:{}] -> (e2:{}) "
+    def get_entity_tree(self, entity_id: str, trees: EntityForest, reverse: bool = False, batched: bool = False):
+        if 'entity_to_entity' not in self.SCHEMA:
+            return self.get_entity_root_tree(entity_id, trees)
 
-        query = query_tplt.format(self.SCHEMA['entity'], self.SCHEMA['entity_to_entity'], self.SCHEMA['entity'])
-        if self.SCHEMA['entity_properties']['id'] != 'ID':
-            query += "WHERE toString(e2.{}) = \"{}\" {} RETURN e1,e2".format(self.SCHEMA['entity_properties']['id'],
-                                                                             entity_id, version_filter)
-        else:
-            query += "WHERE ID(e2) = {} {} RETURN e1,e2".format(entity_id, version_filter)
+        if batched:
+            return self.get_entity_tree_batched(entity_id, trees, reverse)
 
-        with self.driver.session() as session:
-            results = session.run(query)
-            entities: List[Tuple[Entity, Entity]] = [(Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2'),
-                                                      Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1'))
-                                                     for r in results.data()]
+        entities: List[Tuple[Entity, Entity]] = self.parse_entity_pairs(
+            self.records('entity_tree', entity_id, reverse))
         if len(entities) == 0:
-            root_tree = EntityTree([])
-            entity = self.get_entity_by_id(entity_id)
-            if entity is None:
-                return trees
-            root_tree.nodes[entity] = []
-            trees.add_trees([root_tree])
-            return trees
+            return self.get_entity_root_tree(entity_id, trees)
 
         new_rels: List[EntityRelationship] = [EntityRelationship(tup[0], tup[1]) for tup in entities]
         trees.add_trees([EntityTree([rel]) for rel in new_rels])
@@ -421,109 +348,36 @@ class Skg_Reader:
             self.get_entity_tree(child, trees, reverse)
         return trees
 
-    def get_activities(self):
-        version_filter = ''
-        if 'version' in self.SCHEMA:
-            version_filter = "WHERE s:{}".format(self.SCHEMA['version'])
+    def get_entity_tree_batched(self, entity_id: str, trees: EntityForest, reverse: bool = False):
+        # Visits the tree breadth-first, with one query per level instead of one per node,
+        # and adds it to the forest as a single EntityTree.
+        arcs: List[EntityRelationship] = []
+        visited: Set[str] = {str(entity_id)}
+        frontier: List[str] = [entity_id]
+        while len(frontier) > 0:
+            frontier = self.expand_tree_level(self.records('entity_tree_level', frontier, reverse), arcs, visited)
 
-        with self.driver.session() as session:
-            activities = session.run("MATCH (s:{}) {} RETURN s".format(self.SCHEMA['activity'], version_filter))
-            return [Activity.parse_act(s, self.SCHEMA['activity_properties']) for s in activities.data()]
+        if len(arcs) == 0:
+            return self.get_entity_root_tree(entity_id, trees)
+
+        trees.add_trees([EntityTree(arcs)])
+        return trees
+
+    def get_activities(self):
+        activities = self.records('activities')
+        return [Activity.parse_act(s, self.SCHEMA['activity_properties']) for s in activities]
 
     def get_related_entities(self, entity_from: str = None, entity_to: str = None,
                              filter1: str = None, filter2: str = None,
                              limit: int = None, random: bool = False):
-        query = ""
-        if entity_from is None:
-            query += 'MATCH (e1:{})'.format(self.SCHEMA['Entity'])
-        else:
-            query += 'MATCH (e1:{})'.format(entity_from)
-
-        if entity_from is None or entity_to is None:
-            query += ' -> '
-        else:
-            for rels in self.SCHEMA['custom_entity_to_entity']:
-                if rels['from'] == entity_from and rels['to'] == entity_to:
-                    query += ' -[:{}]-> '.format(rels['name'])
-                    break
-
-        if entity_to is None:
-            query += ' (e2:{}) '.format(self.SCHEMA['Entity'])
-        else:
-            query += ' (e2:{}) '.format(entity_to)
-
-        if filter1 is not None:
-            query += ' WHERE e1.{}=\"{}\" '.format(self.SCHEMA['entity_properties']['id'], filter1)
-
-        if filter1 is None and filter2 is not None:
-            query += ' WHERE e2.{}=\"{}\" '.format(self.SCHEMA['entity_properties']['id'], filter2)
-        elif filter1 is not None and filter2 is not None:
-            if filter1 is not None:
-                query += ' and e2.{}=\"{}\" '.format(self.SCHEMA['entity_properties']['id'], filter1)
-
-        query += 'RETURN e1,e2'
-
-        if random:
-            query += ',rand() as r ORDER BY r'
-
-        if limit is not None:
-            query += ' LIMIT {}'.format(limit)
-
-        with self.driver.session() as session:
-            results = session.run(query)
-            entities: List[Tuple[Entity, Entity]] = [(Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e2'),
-                                                      Entity.parse_ent(r, self.SCHEMA['entity_properties'], 'e1'))
-                                                     for r in results.data()]
+        entities: List[Tuple[Entity, Entity]] = self.parse_entity_pairs(
+            self.records('related_entities', entity_from, entity_to, filter1, filter2, limit, random))
 
         return entities
 
     def get_invariants(self, automaton_name: str, start: int, end: int, loc_name: str):
-        query = """MATCH (a:{}) <-[:{}]- (l:{}:{}) -[:MODELS]-> (s:{}) -[:APPLIES]-> (f:{}) 
-        -[:OUTPUT]-> (e:{}), (g:GraphModel:Instance)
-        WHERE a.{} = '{}' and a.{} = '{}' and a.{} = '{}' and l.{} = '{}'
-        RETURN l,s,f,e"""
-        query = query.format(self.SHA_LABELS["automaton_label"], self.SHA_LABELS["has"],
-                             self.SHA_LABELS["automaton_feature"], self.SHA_LABELS["location_label"],
-                             self.SCHEMA["resource"], self.SCHEMA["res_time_distr"], self.SCHEMA["entity_type"],
-                             self.SHA_LABELS["automaton_attr"]["name"], automaton_name,
-                             self.SHA_LABELS["automaton_attr"]["start"], start,
-                             self.SHA_LABELS["automaton_attr"]["end"], end,
-                             self.SHA_LABELS["location_attr"]["name"], loc_name)
-
-        with self.driver.session() as session:
-            results = session.run(query)
-            entities: List[TimeDistr] = [TimeDistr(r['e']['code'], r['s']['sysId'],
-                                                   {a: r['f'][self.SCHEMA['res_time_distr_attr'][a]] for a in
-                                                    self.SCHEMA['res_time_distr_attr']}) for r in results.data()]
-
-        return entities
+        return self.parse_invariants(self.records('invariants', automaton_name, start, end, loc_name))
 
     def get_prob_weights(self, automaton_name: str, start: int, end: int,
                          sync: str, source_name: str):
-        query = """MATCH (a:{}) <-[:{}]- (e:{}:{}) -[:LABELED_BY]-> 
-        (s:MachinePart:Sensor) -[:PART_OF]-> (st:{}), (c:Connection:Ensemble) <-[:BELONGS_TO]- 
-        (r:{}) <-[:OCCUPIES]- (et:{}), (st2:{}) <-[:MODELS]- (src:{}:{}) -[:{}]-> (e)
-        WHERE a.{}='{}' and a.{}='{}' and a.{}='{}' and e.{}='{}' and src.{}='{}'
-        and (st) <-[:DESTINATION]- (c) and (st2) -[:ORIGIN]-> (c)
-        RETURN e, s, st, c, r, et, src, st2"""
-        query = query.format(self.SHA_LABELS["automaton_label"], self.SHA_LABELS["has"],
-                             self.SHA_LABELS["automaton_feature"],
-                             self.SHA_LABELS["edge_label"], self.SCHEMA["resource"], self.SCHEMA["route"],
-                             self.SCHEMA["entity_type"], self.SCHEMA["resource"],
-                             self.SHA_LABELS["automaton_feature"], self.SHA_LABELS["location_label"],
-                             self.SHA_LABELS["edge_to_source"], self.SHA_LABELS["automaton_attr"]["name"],
-                             automaton_name,
-                             self.SHA_LABELS["automaton_attr"]["start"], start,
-                             self.SHA_LABELS["automaton_attr"]["end"], end,
-                             self.SHA_LABELS["edge_attr"]["event"], sync, self.SHA_LABELS["location_attr"]["name"],
-                             source_name)
-
-        with self.driver.session() as session:
-            results = session.run(query)
-            entities: List[Tuple[float, TimeDistr]] = [(float(r['r'][self.SCHEMA['route_attr']['probability']]),
-                                                        TimeDistr(r['et']['code'], r['st']['sysId'],
-                                                                  {a: r['r'][self.SCHEMA['route_attr'][a]] for a in
-                                                                   self.SCHEMA['route_attr']})) for r in
-                                                       results.data()]
-
-        return entities
+        return self.parse_prob_weights(self.records('prob_weights', automaton_name, start, end, sync, source_name))
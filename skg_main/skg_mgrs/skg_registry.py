@@ -0,0 +1,112 @@
+import configparser
+import json
+import os
+import threading
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main'
+CONFIG_PATH = ROOT + '/resources/config/config.ini'
+
+REQUIRED_SCHEMA_KEYS = ['event', 'event_labels', 'event_properties', 'entity', 'entity_labels', 'entity_properties',
+                        'activity', 'activity_labels', 'activity_properties', 'event_to_item', 'event_to_resource']
+REQUIRED_LABELS_KEYS = ['automaton_label', 'automaton_feature', 'automaton_attr', 'has', 'location_label',
+                        'location_attr', 'edge_label', 'edge_attr', 'edge_to_source', 'edge_to_target']
+
+# Process-wide registry of configuration and schemas: config.ini, instance settings, schema files and sha.json
+# are each read once, on first use, and the same objects are then shared by reference by all readers and writers,
+# which must treat them as read-only.
+LOCK = threading.RLock()
+CONFIG: configparser.ConfigParser = None
+INSTANCE_CONFIGS: Dict[str, configparser.ConfigParser] = {}
+SCHEMAS: Dict[str, Dict] = {}
+LABELS: Dict = None
+QUERIES: Dict = {}
+
+
+def get_config():
+    global CONFIG
+    with LOCK:
+        if CONFIG is None:
+            config = configparser.ConfigParser()
+            config.read(CONFIG_PATH)
+            CONFIG = config
+        return CONFIG
+
+
+def get_instance_config(instance: str):
+    # Settings of a non-env_var Neo4j instance, read from the working directory as connector_mgr always did.
+    with LOCK:
+        if instance not in INSTANCE_CONFIGS:
+            config = configparser.ConfigParser()
+            config.read('{}/resources/config/{}.ini'.format(os.getcwd(), instance))
+            INSTANCE_CONFIGS[instance] = config
+        return INSTANCE_CONFIGS[instance]
+
+
+def get_schema_name():
+    config = get_config()
+    if config['NEO4J INSTANCE']['instance'].lower() == 'env_var':
+        return os.environ['NEO4J_SCHEMA']
+    else:
+        return config['NEO4J SCHEMA']['schema.name']
+
+
+def validate(name: str, content: Dict, required_keys):
+    missing = [k for k in required_keys if k not in content]
+    if len(missing) > 0:
+        raise ValueError('{} is missing required keys: {}.'.format(name, ', '.join(missing)))
+
+
+def validate_schema(name: str, schema: Dict):
+    validate('Schema {}'.format(name), schema, REQUIRED_SCHEMA_KEYS)
+    validate('Schema {} event_properties'.format(name), schema['event_properties'], ['act', 'timestamp'])
+    validate('Schema {} entity_properties'.format(name), schema['entity_properties'], ['id'])
+    validate('Schema {} activity_properties'.format(name), schema['activity_properties'], ['id'])
+
+
+def get_schema(name: str = None):
+    if name is None:
+        name = get_schema_name()
+    with LOCK:
+        if name not in SCHEMAS:
+            path = get_config()['NEO4J SCHEMA']['schema.path'].format(ROOT, name)
+            with open(path) as f:
+                schema = json.load(f)
+            validate_schema(name, schema)
+            SCHEMAS[name] = schema
+        return SCHEMAS[name]
+
+
+def get_labels():
+    global LABELS
+    with LOCK:
+        if LABELS is None:
+            path = get_config()['AUTOMATA TO SKG']['labels.path'].format(ROOT)
+            with open(path) as f:
+                labels = json.load(f)
+            validate('Labels file {}'.format(path), labels, REQUIRED_LABELS_KEYS)
+            LABELS = labels
+        return LABELS
+
+
+def get_queries(name: str = None):
+    # Query builders (and their memoized templates) are shared as well, one per schema.
+    from skg_main.skg_mgrs.skg_queries import Skg_Queries
+
+    if name is None:
+        name = get_schema_name()
+    with LOCK:
+        if name not in QUERIES:
+            QUERIES[name] = Skg_Queries(get_schema(name), get_labels())
+        return QUERIES[name]
+
+
+def clear():
+    # Forgets everything loaded so far, e.g., after editing a schema file in a long-running process.
+    global CONFIG, LABELS
+    with LOCK:
+        CONFIG = None
+        LABELS = None
+        INSTANCE_CONFIGS.clear()
+        SCHEMAS.clear()
+        QUERIES.clear()
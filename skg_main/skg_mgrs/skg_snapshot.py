@@ -0,0 +1,75 @@
+import pickle
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+import skg_main.skg_mgrs.skg_instrumentation as skg_instrumentation
+import skg_main.skg_mgrs.skg_registry as skg_registry
+from skg_main.skg_logger.logger import Logger
+
+if TYPE_CHECKING:
+    from neo4j import Driver
+
+LOGGER = Logger('SKG Snapshot')
+
+# (element id, node id, labels, properties)
+Node = Tuple[str, int, List[str], Dict]
+# (type, source element id, target element id)
+Relationship = Tuple[str, str, str]
+
+# First bytes of columnar snapshot files.
+COLUMNAR_MAGIC = b'SKGCOLS1'
+
+
+def is_columnar(path: str):
+    with open(path, 'rb') as f:
+        return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+# Frozen copy of the part of an SKG that Skg_Reader queries: event, entity, activity and resource nodes,
+# and the relationships between events and entities and among entities, as defined by the schema.
+# Events can be restricted to a time window. Snapshots are saved either pickled or in the memory-mappable
+# columnar format of skg_columnar (see save_columnar), and load recognizes both: columnar files are then decoded
+# into Python objects (use Columnar_Snapshot, or Skg_Memory_Backend.load, to keep them memory-mapped).
+class Skg_Snapshot:
+    def __init__(self, schema_name: str, nodes: List[Node], relationships: List[Relationship]):
+        self.schema_name = schema_name
+        self.nodes = nodes
+        self.relationships = relationships
+
+    @staticmethod
+    def from_driver(driver: 'Driver', schema_name: str = None, fetch_size: int = 10000, start_t=None, end_t=None):
+        if schema_name is None:
+            schema_name = skg_registry.get_schema_name()
+        queries = skg_registry.get_queries(schema_name)
+
+        with skg_instrumentation.instrument(driver.session(fetch_size=fetch_size), 'snapshot') as session:
+            nodes: List[Node] = [(r['element_id'], r['id'], r['labels'], r['props'])
+                                 for r in session.run(*queries.snapshot_nodes(start_t, end_t))]
+            # Relationships to events outside the window are dropped.
+            element_ids = set(n[0] for n in nodes)
+            relationships: List[Relationship] = [(r['type'], r['source'], r['target'])
+                                                 for r in session.run(*queries.snapshot_relationships())
+                                                 if r['source'] in element_ids and r['target'] in element_ids]
+        LOGGER.info('Took snapshot of {} nodes and {} relationships.', len(nodes), len(relationships))
+        return Skg_Snapshot(schema_name, nodes, relationships)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            pickle.dump({'schema_name': self.schema_name, 'nodes': self.nodes,
+                         'relationships': self.relationships}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save_columnar(self, path: str):
+        # numpy is only imported when columnar snapshots are used.
+        from skg_main.skg_mgrs.skg_columnar import Columnar_Snapshot
+
+        Columnar_Snapshot.write(self, path)
+
+    @staticmethod
+    def load(path: str):
+        if is_columnar(path):
+            from skg_main.skg_mgrs.skg_columnar import Columnar_Snapshot
+
+            return Columnar_Snapshot(path).to_snapshot()
+
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        return Skg_Snapshot(snapshot['schema_name'], snapshot['nodes'], snapshot['relationships'])
@@ -1,44 +1,29 @@
-import configparser
-import json
-import os
-from typing import List
-
-from neo4j import Driver
+from typing import Callable, Dict, List, Tuple, Union, TYPE_CHECKING
 
+import skg_main.skg_mgrs.skg_instrumentation as skg_instrumentation
+import skg_main.skg_mgrs.skg_registry as skg_registry
 from skg_main.skg_logger.logger import Logger
 from skg_main.skg_model.automata import Automaton, Edge, Location
 from skg_main.skg_model.schema import Activity, Entity
 
-config = configparser.ConfigParser()
-config.read(os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main/resources/config/config.ini')
-config.sections()
+if TYPE_CHECKING:
+    from neo4j import Driver, ManagedTransaction
 
 LOGGER = Logger('SKG Writer')
 
 
 class Skg_Writer:
     def setup(self):
-        LABELS_PATH = config['AUTOMATA TO SKG']['labels.path'].format(
-            os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main')
-        LABELS = json.load(open(LABELS_PATH))
-
-        NEO4J_CONFIG = config['NEO4J INSTANCE']['instance']
-
-        if NEO4J_CONFIG.lower() == 'env_var':
-            SCHEMA_NAME = os.environ['NEO4J_SCHEMA']
-        else:
-            SCHEMA_NAME = config['NEO4J SCHEMA']['schema.name']
-
-        SCHEMA_PATH = config['NEO4J SCHEMA']['schema.path'].format(
-            os.path.dirname(os.path.abspath(__file__)).split('skg_main')[0] + 'skg_main', SCHEMA_NAME)
-        SCHEMA = json.load(open(SCHEMA_PATH))
+        return skg_registry.get_labels(), skg_registry.get_schema()
 
-        return LABELS, SCHEMA
-
-    def __init__(self, driver: Driver):
+    def __init__(self, driver: 'Driver'):
         self.driver = driver
         self.LABELS, self.SCHEMA = self.setup()
 
+    def session(self, **config):
+        # Queries are attributed to the writer method running them (see skg_instrumentation).
+        return skg_instrumentation.instrument(self.driver.session(**config))
+
     def get_sha_query_filter(self, automaton_name: str = None, pov=None, start=None, end=None, identifier='a'):
         if automaton_name is None and pov is None and start is None and end is None:
             return None
@@ -62,8 +47,8 @@ class Skg_Writer:
 
             return query_filter
 
-    def write_automaton(self, name: str = None, pov=None, start=None, end=None, path=None):
-        AUTOMATON_PATH = config['AUTOMATA TO SKG']['automaton.path']
+    def load_automaton(self, name: str = None, path=None):
+        AUTOMATON_PATH = skg_registry.get_config()['AUTOMATA TO SKG']['automaton.path']
 
         if name is None:
             AUTOMATON_NAME = AUTOMATON_PATH.split('/')[-1].split('.')[0]
@@ -71,9 +56,18 @@ class Skg_Writer:
             AUTOMATON_NAME = name
             AUTOMATON_PATH = AUTOMATON_PATH.format(path, AUTOMATON_NAME)
 
-        LOGGER.info('Loading {}...'.format(AUTOMATON_PATH))
+        LOGGER.info('Loading {}...', AUTOMATON_PATH)
         automaton = Automaton(name=AUTOMATON_NAME, filename=AUTOMATON_PATH)
-        LOGGER.info('Found {} locations, {} edges.'.format(len(automaton.locations), len(automaton.edges)))
+        LOGGER.info('Found {} locations, {} edges.', len(automaton.locations), len(automaton.edges))
+        return automaton
+
+    def write_automaton(self, name: str = None, pov=None, start=None, end=None, path=None, batched: bool = False):
+        automaton = self.load_automaton(name, path)
+        AUTOMATON_NAME = automaton.name
+
+        if batched:
+            new_automaton_id = self.write_automaton_batched(automaton, pov, start, end)
+            return automaton, new_automaton_id
 
         AUTOMATON_QUERY = """
             CREATE (a:{} {{ {}: \"{}\", {}: \"{}\", {}: \"{}\", {}: \"{}\" }})
@@ -81,7 +75,7 @@ class Skg_Writer:
         """.format(self.LABELS['automaton_label'], self.LABELS['automaton_attr']['name'], AUTOMATON_NAME,
                    self.LABELS['automaton_attr']['pov'], pov, self.LABELS['automaton_attr']['start'], start,
                    self.LABELS['automaton_attr']['end'], end)
-        with self.driver.session() as session:
+        with self.session() as session:
             result = session.run(AUTOMATON_QUERY)
             new_automaton_id = [r['elementId(a)'] for r in result.data()][0]
         LOGGER.info("Created Automaton node.")
@@ -96,7 +90,7 @@ class Skg_Writer:
                                           self.get_sha_query_filter(AUTOMATON_NAME, pov, start, end),
                                           self.LABELS['location_label'], self.LABELS['automaton_feature'],
                                           self.LABELS['location_attr']['name'], location.name, self.LABELS['has'])
-            with self.driver.session() as session:
+            with self.session() as session:
                 session.run(query)
         LOGGER.info("Created Location nodes.")
 
@@ -117,61 +111,279 @@ class Skg_Writer:
                                              self.LABELS['edge_to_source'], self.LABELS['edge_label'],
                                              self.LABELS['automaton_feature'], self.LABELS['edge_attr']['event'],
                                              edge.label, self.LABELS['edge_to_target'], self.LABELS['has'])
-            with self.driver.session() as session:
+            with self.session() as session:
                 session.run(query)
         LOGGER.info("Created Edge nodes.")
 
         return automaton, new_automaton_id
 
-    def cleanup_all(self):
+    def write_automaton_tx(self, tx: 'ManagedTransaction', automaton: Automaton, pov=None, start=None, end=None):
+        # Values are stored as strings, consistently with the unbatched queries.
+        AUTOMATON_QUERY = """
+            CREATE (a:{} {{ {}: $name, {}: $pov, {}: $start, {}: $end }})
+            RETURN elementId(a) AS id
+        """.format(self.LABELS['automaton_label'], self.LABELS['automaton_attr']['name'],
+                   self.LABELS['automaton_attr']['pov'], self.LABELS['automaton_attr']['start'],
+                   self.LABELS['automaton_attr']['end'])
+        result = tx.run(AUTOMATON_QUERY, name=str(automaton.name), pov=str(pov), start=str(start), end=str(end))
+        new_automaton_id = result.single(strict=True)['id']
+
+        LOCATION_QUERY = """
+            MATCH (a) WHERE elementId(a) = $automaton_id
+            UNWIND $locations AS loc_name
+            CREATE (l:{}:{} {{ {}: loc_name }}) -[:{}]-> (a)
+            RETURN loc_name, elementId(l) AS id
+        """.format(self.LABELS['location_label'], self.LABELS['automaton_feature'],
+                   self.LABELS['location_attr']['name'], self.LABELS['has'])
+        result = tx.run(LOCATION_QUERY, automaton_id=new_automaton_id,
+                        locations=[location.name for location in automaton.locations])
+        location_ids = {r['loc_name']: r['id'] for r in result}
+
+        EDGE_TO_LOC_QUERY = """
+            MATCH (a) WHERE elementId(a) = $automaton_id
+            UNWIND $edges AS edge
+            MATCH (s) WHERE elementId(s) = edge.source
+            MATCH (t) WHERE elementId(t) = edge.target
+            CREATE (s) -[:{}]-> (e:{}:{} {{ {}: edge.event }}) -[:{}]-> (t)
+            CREATE (a) <-[:{}]- (e)
+        """.format(self.LABELS['edge_to_source'], self.LABELS['edge_label'], self.LABELS['automaton_feature'],
+                   self.LABELS['edge_attr']['event'], self.LABELS['edge_to_target'], self.LABELS['has'])
+        tx.run(EDGE_TO_LOC_QUERY, automaton_id=new_automaton_id,
+               edges=[{'source': location_ids[edge.source.name], 'event': edge.label,
+                       'target': location_ids[edge.target.name]} for edge in automaton.edges]).consume()
+
+        return new_automaton_id
+
+    def write_automaton_batched(self, automaton: Automaton, pov=None, start=None, end=None):
+        # Writes the automaton, its locations and its edges in a single transaction:
+        # if any step fails, nothing is stored.
+        with self.session() as session:
+            new_automaton_id = session.execute_write(self.write_automaton_tx, automaton, pov, start, end)
+        LOGGER.info("Created Automaton with {} Location and {} Edge nodes.", len(automaton.locations),
+                    len(automaton.edges))
+        return new_automaton_id
+
+    def find_automaton_tx(self, tx: 'ManagedTransaction', automaton_name: str, pov=None, start=None, end=None):
+        AUTOMATON_QUERY = """
+            MATCH (a:{}) WHERE a.{} = $name and a.{} = $pov and a.{} = $start and a.{} = $end
+            RETURN elementId(a) AS id
+        """.format(self.LABELS['automaton_label'], self.LABELS['automaton_attr']['name'],
+                   self.LABELS['automaton_attr']['pov'], self.LABELS['automaton_attr']['start'],
+                   self.LABELS['automaton_attr']['end'])
+        result = tx.run(AUTOMATON_QUERY, name=str(automaton_name), pov=str(pov), start=str(start), end=str(end))
+        automaton_ids = [r['id'] for r in result]
+        return automaton_ids[0] if len(automaton_ids) > 0 else None
+
+    def get_features_tx(self, tx: 'ManagedTransaction', automaton_id: str):
+        # Element ids of the stored locations, by name, and of the stored edges, by (source name, event, target name).
+        STORED_LOCATIONS_QUERY = """
+            MATCH (l:{}) -[:{}]-> (a) WHERE elementId(a) = $automaton_id
+            RETURN l.{} AS name, elementId(l) AS id
+        """.format(self.LABELS['location_label'], self.LABELS['has'], self.LABELS['location_attr']['name'])
+        location_ids: Dict[str, str] = {r['name']: r['id'] for r in tx.run(STORED_LOCATIONS_QUERY,
+                                                                           automaton_id=automaton_id)}
+
+        STORED_EDGES_QUERY = """
+            MATCH (s:{}) -[:{}]-> (e:{}) -[:{}]-> (t:{}), (e) -[:{}]-> (a) WHERE elementId(a) = $automaton_id
+            RETURN s.{} AS source, e.{} AS event, t.{} AS target, elementId(e) AS id
+        """.format(self.LABELS['location_label'], self.LABELS['edge_to_source'], self.LABELS['edge_label'],
+                   self.LABELS['edge_to_target'], self.LABELS['location_label'], self.LABELS['has'],
+                   self.LABELS['location_attr']['name'], self.LABELS['edge_attr']['event'],
+                   self.LABELS['location_attr']['name'])
+        edge_ids: Dict[Tuple[str, str, str], List[str]] = {}
+        for r in tx.run(STORED_EDGES_QUERY, automaton_id=automaton_id):
+            edge_ids.setdefault((r['source'], r['event'], r['target']), []).append(r['id'])
+
+        return location_ids, edge_ids
+
+    def update_automaton_tx(self, tx: 'ManagedTransaction', automaton: Automaton, pov=None, start=None, end=None):
+        # Diffs automaton against the stored one with the same name/pov/start/end: only locations and edges that
+        # are not stored yet are created, and only stored ones that are no longer in the automaton are deleted.
+        # Unchanged elements keep their nodes, hence their semantic links.
+        # Edges are identified by (source name, event, target name), locations by name.
+        automaton_id = self.find_automaton_tx(tx, automaton.name, pov, start, end)
+        if automaton_id is None:
+            return self.write_automaton_tx(tx, automaton, pov, start, end), len(automaton.locations), \
+                   len(automaton.edges), 0, 0
+
+        location_ids, stored_edges = self.get_features_tx(tx, automaton_id)
+
+        new_edges: List[Edge] = []
+        for edge in automaton.edges:
+            ids = stored_edges.get((edge.source.name, edge.label, edge.target.name), [])
+            if len(ids) > 0:
+                ids.pop()
+            else:
+                new_edges.append(edge)
+        removed_edges = [e_id for ids in stored_edges.values() for e_id in ids]
+
+        names = set(location.name for location in automaton.locations)
+        new_locations = [location.name for location in automaton.locations if location.name not in location_ids]
+        removed_locations = [l_id for name, l_id in location_ids.items() if name not in names]
+
         DELETE_QUERY = """
-        MATCH (x: {})
+            UNWIND $ids AS id
+            MATCH (x) WHERE elementId(x) = id
+            DETACH DELETE x
+        """
+        if len(removed_edges) + len(removed_locations) > 0:
+            tx.run(DELETE_QUERY, ids=removed_edges + removed_locations).consume()
+
+        LOCATION_QUERY = """
+            MATCH (a) WHERE elementId(a) = $automaton_id
+            UNWIND $locations AS loc_name
+            CREATE (l:{}:{} {{ {}: loc_name }}) -[:{}]-> (a)
+            RETURN loc_name, elementId(l) AS id
+        """.format(self.LABELS['location_label'], self.LABELS['automaton_feature'],
+                   self.LABELS['location_attr']['name'], self.LABELS['has'])
+        if len(new_locations) > 0:
+            result = tx.run(LOCATION_QUERY, automaton_id=automaton_id, locations=new_locations)
+            location_ids.update({r['loc_name']: r['id'] for r in result})
+
+        EDGE_TO_LOC_QUERY = """
+            MATCH (a) WHERE elementId(a) = $automaton_id
+            UNWIND $edges AS edge
+            MATCH (s) WHERE elementId(s) = edge.source
+            MATCH (t) WHERE elementId(t) = edge.target
+            CREATE (s) -[:{}]-> (e:{}:{} {{ {}: edge.event }}) -[:{}]-> (t)
+            CREATE (a) <-[:{}]- (e)
+        """.format(self.LABELS['edge_to_source'], self.LABELS['edge_label'], self.LABELS['automaton_feature'],
+                   self.LABELS['edge_attr']['event'], self.LABELS['edge_to_target'], self.LABELS['has'])
+        if len(new_edges) > 0:
+            tx.run(EDGE_TO_LOC_QUERY, automaton_id=automaton_id,
+                   edges=[{'source': location_ids[edge.source.name], 'event': edge.label,
+                           'target': location_ids[edge.target.name]} for edge in new_edges]).consume()
+
+        return automaton_id, len(new_locations), len(new_edges), len(removed_locations), len(removed_edges)
+
+    def update_automaton(self, name: str = None, pov=None, start=None, end=None, path=None,
+                         automaton: Automaton = None):
+        # Same arguments as write_automaton; an already loaded automaton can be passed instead of its DOT file.
+        # The automaton is created if it is not stored yet.
+        if automaton is None:
+            automaton = self.load_automaton(name, path)
+
+        with self.session() as session:
+            automaton_id, new_locs, new_edges, old_locs, old_edges = session.execute_write(
+                self.update_automaton_tx, automaton, pov, start, end)
+        LOGGER.info("Updated Automaton: {} Location and {} Edge nodes created, {} Location and {} Edge nodes "
+                    "deleted.", new_locs, new_edges, old_locs, old_edges)
+        return automaton, automaton_id
+
+    def delete_in_batches(self, session, match: str, label: str, batch_size: int, progress: Callable = None):
+        # Deletes the nodes matched as x in batches of at most batch_size, each in its own transaction,
+        # so that the server never holds a huge delete in memory, until no node is left.
+        # progress, if given, is called after each batch with the running totals.
+        DELETE_QUERY = """
+        {}
+        WITH x LIMIT $batch_size
         DETACH DELETE x
         """
 
-        query = DELETE_QUERY.format(self.LABELS['automaton_label'])
-        with self.driver.session() as session:
-            session.run(query)
-        LOGGER.info("Deleted all automata nodes.")
+        nodes, rels = 0, 0
+        while True:
+            counters = session.run(DELETE_QUERY.format(match), {'batch_size': int(batch_size)}).consume().counters
+            if counters.nodes_deleted == 0:
+                break
+            nodes, rels = nodes + counters.nodes_deleted, rels + counters.relationships_deleted
+            if progress is not None:
+                progress(label, nodes, rels)
+        LOGGER.info("Deleted {} {} nodes, {} relationships.", nodes, label, rels)
+        return nodes, rels
 
-        query = DELETE_QUERY.format(self.LABELS['location_label'])
-        with self.driver.session() as session:
-            session.run(query)
-        LOGGER.info("Deleted all location nodes.")
+    def get_batch_size(self, batch_size: int = None):
+        if batch_size is None:
+            batch_size = int(skg_registry.get_config()['AUTOMATA TO SKG']['cleanup.batch_size'])
+        return batch_size
 
-        query = DELETE_QUERY.format(self.LABELS['edge_label'])
-        with self.driver.session() as session:
-            session.run(query)
-        LOGGER.info("Deleted all edge nodes.")
+    def cleanup_all(self, batch_size: int = None, progress: Callable = None):
+        # progress, if given, is called as progress(label, nodes_deleted, relationships_deleted) after each batch,
+        # with the totals deleted so far for the label.
+        batch_size = self.get_batch_size(batch_size)
+        MATCH_QUERY = "MATCH (x: {})"
+
+        nodes, rels = 0, 0
+        with self.session() as session:
+            for label in [self.LABELS['automaton_label'], self.LABELS['location_label'], self.LABELS['edge_label']]:
+                deleted = self.delete_in_batches(session, MATCH_QUERY.format(label), label, batch_size, progress)
+                nodes, rels = nodes + deleted[0], rels + deleted[1]
 
-    def cleanup(self, automaton_name: str = None, pov=None, start=None, end=None):
+        return {'nodes_deleted': nodes, 'relationships_deleted': rels}
+
+    def cleanup(self, automaton_name: str = None, pov=None, start=None, end=None, batch_size: int = None,
+                progress: Callable = None):
         if automaton_name is None and pov is None and start is None and end is None:
-            self.cleanup_all()
-        else:
-            DELETE_QUERY = """
-            MATCH (s:{}) -[:{}]-> (a:{}) 
-            WHERE {} 
-            DETACH DELETE s
-            """
+            return self.cleanup_all(batch_size, progress)
 
-            query = DELETE_QUERY.format(self.LABELS['automaton_feature'], self.LABELS['has'],
-                                        self.LABELS['automaton_label'],
-                                        self.get_sha_query_filter(automaton_name, pov, start, end))
-            with self.driver.session() as session:
-                session.run(query)
-            LOGGER.info("Deleted {} features.".format(automaton_name))
+        batch_size = self.get_batch_size(batch_size)
+        FEATURES_QUERY = """
+        MATCH (x:{}) -[:{}]-> (a:{})
+        WHERE {}
+        """
+        AUTOMATON_QUERY = """
+        MATCH (x: {})
+        WHERE {}
+        """
 
-            DELETE_QUERY = """
-            MATCH (a: {})
-            WHERE {}
-            DETACH DELETE a
-            """
+        with self.session() as session:
+            features = self.delete_in_batches(session, FEATURES_QUERY.format(
+                self.LABELS['automaton_feature'], self.LABELS['has'], self.LABELS['automaton_label'],
+                self.get_sha_query_filter(automaton_name, pov, start, end)), self.LABELS['automaton_feature'],
+                batch_size, progress)
+            automata = self.delete_in_batches(session, AUTOMATON_QUERY.format(
+                self.LABELS['automaton_label'], self.get_sha_query_filter(automaton_name, pov, start, end, 'x')),
+                self.LABELS['automaton_label'], batch_size, progress)
+        LOGGER.info("Deleted {}, {}, {}, {} node.", automaton_name, pov, start, end)
 
-            query = DELETE_QUERY.format(self.LABELS['automaton_label'],
-                                        self.get_sha_query_filter(automaton_name, pov, start, end))
-            with self.driver.session() as session:
-                session.run(query)
-            LOGGER.info("Deleted {}, {}, {}, {} node.".format(automaton_name, pov, start, end))
+        return {'nodes_deleted': features[0] + automata[0], 'relationships_deleted': features[1] + automata[1]}
+
+    def get_index_specs(self):
+        # (name, label, properties) of the range indexes backing the reader's lookups, derived from the schema.
+        specs: List[Tuple[str, str, Tuple[str, ...]]] = []
+
+        def add(label: str, props: List[str]):
+            # Indexes are defined on a single label: the first one of multi-label nodes (e.g., Automaton:Instance).
+            label = label.split(':')[0]
+            props = tuple(props)
+            if all(spec[1:] != (label, props) for spec in specs):
+                name = 'skg_{}_{}'.format(label, '_'.join(props))
+                specs.append((''.join(c if c.isalnum() else '_' for c in name), label, props))
+
+        add(self.SCHEMA['event'], [self.SCHEMA['event_properties']['timestamp']])
+        if 'date' in self.SCHEMA['event_properties']:
+            add(self.SCHEMA['event'], [self.SCHEMA['event_properties']['date']])
+        if self.SCHEMA['entity_properties']['id'] != 'ID':
+            add(self.SCHEMA['entity'], [self.SCHEMA['entity_properties']['id']])
+        for prop in self.SCHEMA['activity_properties']['id']:
+            add(self.SCHEMA['activity'], [prop])
+        # The composite index serves exact automaton lookups, the single one those by name only (e.g., cleanup).
+        add(self.LABELS['automaton_label'], [self.LABELS['automaton_attr'][a] for a in ['name', 'pov', 'start', 'end']])
+        add(self.LABELS['automaton_label'], [self.LABELS['automaton_attr']['name']])
+        return specs
+
+    def get_missing_indexes(self):
+        with self.session() as session:
+            existing = [(tuple(r['labelsOrTypes'] or []), tuple(r['properties'] or []))
+                        for r in session.run("SHOW INDEXES YIELD type, entityType, labelsOrTypes, properties "
+                                             "WHERE entityType = 'NODE' and type IN ['RANGE', 'BTREE'] "
+                                             "RETURN labelsOrTypes, properties").data()]
+        missing = [spec for spec in self.get_index_specs() if ((spec[1],), spec[2]) not in existing]
+        for spec in missing:
+            LOGGER.warn("Missing index on :{}({}).", spec[1], ', '.join(spec[2]))
+        return missing
+
+    def ensure_indexes(self, wait: bool = False, timeout: int = 300):
+        CREATE_QUERY = "CREATE INDEX {} IF NOT EXISTS FOR (n:{}) ON ({})"
+
+        missing = self.get_missing_indexes()
+        with self.session() as session:
+            for name, label, props in missing:
+                session.run(CREATE_QUERY.format(name, label, ', '.join(['n.{}'.format(p) for p in props]))).consume()
+            # New indexes are populated in the background, unless waiting for them to come online.
+            if wait and len(missing) > 0:
+                session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+        LOGGER.info("Created {} indexes.", len(missing))
+        return missing
 
     def create_semantic_link(self, automaton: Automaton, name: str, pov=None, start=None, end=None,
                              edge: Edge = None, loc: Location = None, act: Activity = None, ent: Entity = None,
@@ -224,5 +436,65 @@ class Skg_Writer:
                                         self.get_sha_query_filter(automaton.name, pov, start, end, 'aut'),
                                         self.SCHEMA['entity_properties']['id'], ent.entity_id, name)
 
-        with self.driver.session() as session:
+        with self.session() as session:
             session.run(query)
+
+    def create_semantic_links_tx(self, tx: 'ManagedTransaction', automaton: Automaton, name: str,
+                                 links: List[Tuple[Union[Edge, Location], Union[Activity, Entity]]],
+                                 pov=None, start=None, end=None, entity_labels: List[str] = None):
+        automaton_id = self.find_automaton_tx(tx, automaton.name, pov, start, end)
+        if automaton_id is None:
+            return 0
+        location_ids, edge_ids = self.get_features_tx(tx, automaton_id)
+
+        # Features are resolved to element ids once, instead of re-matching the automaton path for each link.
+        act_links: List[Dict] = []
+        ent_links: List[Dict] = []
+        for feature, target in links:
+            if isinstance(feature, Edge):
+                feature_ids = edge_ids.get((feature.source.name, feature.label, feature.target.name), [])
+            else:
+                feature_ids = [location_ids[feature.name]] if feature.name in location_ids else []
+            if len(feature_ids) == 0:
+                LOGGER.warn("{} is not stored in {}, not linked.",
+                            feature.name if isinstance(feature, Location) else feature.label, automaton.name)
+            for feature_id in feature_ids:
+                if isinstance(target, Activity):
+                    act_links.append({'feature': feature_id, 'target': target.act})
+                else:
+                    ent_links.append({'feature': feature_id, 'target': target.entity_id})
+
+        ACT_LINK_QUERY = """
+            UNWIND $links AS link
+            MATCH (f) WHERE elementId(f) = link.feature
+            MATCH (x:{}) WHERE x.{} = link.target
+            CREATE (f) -[:{}]-> (x)
+        """.format(self.SCHEMA['activity'], self.SCHEMA['activity_properties']['id'][0], name)
+        if self.SCHEMA['entity_properties']['id'] == 'ID':
+            ent_filter = "ID(x) = link.target"
+        else:
+            ent_filter = "x.{} = link.target".format(self.SCHEMA['entity_properties']['id'])
+        ENT_LINK_QUERY = """
+            UNWIND $links AS link
+            MATCH (f) WHERE elementId(f) = link.feature
+            MATCH (x:{}) WHERE {}
+            CREATE (f) -[:{}]-> (x)
+        """.format(':'.join(entity_labels) if entity_labels is not None else self.SCHEMA['entity'], ent_filter, name)
+
+        created = 0
+        if len(act_links) > 0:
+            created += tx.run(ACT_LINK_QUERY, links=act_links).consume().counters.relationships_created
+        if len(ent_links) > 0:
+            created += tx.run(ENT_LINK_QUERY, links=ent_links).consume().counters.relationships_created
+        return created
+
+    def create_semantic_links(self, automaton: Automaton, name: str,
+                              links: List[Tuple[Union[Edge, Location], Union[Activity, Entity]]],
+                              pov=None, start=None, end=None, entity_labels: List[str] = None):
+        # Bulk counterpart of create_semantic_link: links is a list of (edge or location, activity or entity)
+        # pairs, all linked through a relationship of type name, in a single transaction.
+        with self.session() as session:
+            created = session.execute_write(self.create_semantic_links_tx, automaton, name, links, pov, start, end,
+                                            entity_labels)
+        LOGGER.info("Created {} semantic links.", created)
+        return created
@@ -1,7 +1,5 @@
 from typing import List, Dict
 
-import pygraphviz as pgv
-
 
 class Location:
     def __init__(self, name: str):
@@ -29,6 +27,9 @@ class Automaton:
         self.edges: List[Edge] = []
 
         if filename is not None:
+            # pygraphviz is slow to import, and only needed when parsing DOT files.
+            import pygraphviz as pgv
+
             graph = pgv.AGraph(filename)
             for node in graph.nodes():
                 name = node.attr['label'].split('>')[1].split('<')[0]
@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+import numpy as np
+from neo4j.time import DateTime
+
+from skg_main.skg_model.schema import Event, Timestamp
+
+
+def to_column(values: List):
+    if all(isinstance(v, bool) for v in values):
+        return np.array(values, dtype=bool)
+    elif all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return np.array(values, dtype=np.int64)
+    elif all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return np.array(values, dtype=np.float64)
+    else:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+
+def encode(values: List[str]):
+    codes: Dict[str, int] = {}
+    encoded = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.int32, count=len(values))
+    return encoded, list(codes)
+
+
+# Columnar alternative to List[Event] for large extractions: activities are stored as integer codes into a
+# symbol table, timestamps as an int64/float64 array (epoch milliseconds, UTC, for schemas with dates),
+# every other event property as a typed column, and, optionally, the related entity as codes into a second table.
+class EventTable:
+    def __init__(self, activities: np.ndarray, symbols: List[str], timestamps: np.ndarray,
+                 columns: Dict[str, np.ndarray] = None, entities: np.ndarray = None,
+                 entity_symbols: List[str] = None, dates: bool = False):
+        self.activities = activities
+        self.symbols = symbols
+        self.timestamps = timestamps
+        self.columns: Dict[str, np.ndarray] = columns if columns is not None else {}
+        self.entities = entities
+        self.entity_symbols = entity_symbols
+        self.dates = dates
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __str__(self):
+        return 'EventTable({} events, {} activities, columns: {})'.format(len(self), len(self.symbols),
+                                                                         list(self.columns))
+
+    @staticmethod
+    def from_records(records: Iterable[Dict], p: Dict[str, str], entity_key: str = None):
+        # Same conventions as Event.parse_evt: record['e'] holds the event properties.
+        IGNORE_KEYS = [p['act'], p['timestamp']]
+        dates = 'date' in p
+        if dates:
+            IGNORE_KEYS.append(p['date'])
+
+        activities: List[str] = []
+        timestamps: List = []
+        entities: List[str] = []
+        extra_attr: Dict[str, List] = {}
+        for i, r in enumerate(records):
+            attr = r['e']
+            activities.append(attr[p['act']])
+            timestamps.append(Timestamp.epoch_millis(attr[p['timestamp']]) if dates else attr[p['timestamp']])
+            if entity_key is not None:
+                entities.append(str(r[entity_key]))
+            for key in attr:
+                if key not in IGNORE_KEYS:
+                    if key not in extra_attr:
+                        extra_attr[key] = [None] * i
+                    extra_attr[key].append(attr[key])
+            for key in extra_attr:
+                if len(extra_attr[key]) <= i:
+                    extra_attr[key].append(None)
+
+        act_codes, symbols = encode(activities)
+        if dates or all(isinstance(t, int) for t in timestamps):
+            ts_column = np.array(timestamps, dtype=np.int64)
+        else:
+            ts_column = np.array(timestamps, dtype=np.float64)
+
+        if entity_key is not None:
+            ent_codes, entity_symbols = encode(entities)
+        else:
+            ent_codes, entity_symbols = None, None
+
+        return EventTable(act_codes, symbols, ts_column, {k: to_column(v) for k, v in extra_attr.items()},
+                          ent_codes, entity_symbols, dates)
+
+    def take(self, indices):
+        return EventTable(self.activities[indices], self.symbols, self.timestamps[indices],
+                          {k: c[indices] for k, c in self.columns.items()},
+                          self.entities[indices] if self.entities is not None else None,
+                          self.entity_symbols, self.dates)
+
+    def is_sorted(self):
+        return bool(np.all(self.timestamps[:-1] <= self.timestamps[1:]))
+
+    def sort(self):
+        return self.take(np.argsort(self.timestamps, kind='stable'))
+
+    def to_bound(self, t):
+        if isinstance(t, Timestamp):
+            return t.to_epoch_millis()
+        elif isinstance(t, DateTime):
+            return Timestamp.epoch_millis(t)
+        return t
+
+    def slice_time(self, start_t=None, end_t=None):
+        # Same (strict) semantics as the reader's window queries: start_t < t < end_t.
+        if self.is_sorted():
+            lo = 0 if start_t is None else np.searchsorted(self.timestamps, self.to_bound(start_t), side='right')
+            hi = len(self) if end_t is None else np.searchsorted(self.timestamps, self.to_bound(end_t), side='left')
+            return self.take(slice(lo, max(lo, hi)))
+
+        mask = np.ones(len(self), dtype=bool)
+        if start_t is not None:
+            mask &= self.timestamps > self.to_bound(start_t)
+        if end_t is not None:
+            mask &= self.timestamps < self.to_bound(end_t)
+        return self.take(np.flatnonzero(mask))
+
+    def group_by_entity(self):
+        if self.entities is None:
+            raise ValueError('EventTable has no entity column.')
+
+        order = np.argsort(self.entities, kind='stable')
+        codes = self.entities[order]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        groups: Dict[str, EventTable] = {}
+        for indices in np.split(order, bounds):
+            if len(indices) > 0:
+                groups[self.entity_symbols[self.entities[indices[0]]]] = self.take(indices)
+        return groups
+
+    def activity_names(self):
+        return np.array(self.symbols, dtype=object)[self.activities]
+
+    def to_events(self):
+        events: List[Event] = []
+        keys = list(self.columns)
+        for i in range(len(self)):
+            extra_attr = {k: self.columns[k][i].item() if isinstance(self.columns[k][i], np.generic)
+                          else self.columns[k][i] for k in keys if self.columns[k][i] is not None}
+            if self.dates:
+                ts = DateTime.from_native(datetime.fromtimestamp(int(self.timestamps[i]) / 1000, tz=timezone.utc))
+                events.append(Event(self.symbols[self.activities[i]], ts, Timestamp.parse_ts(ts), extra_attr))
+            else:
+                events.append(Event(self.symbols[self.activities[i]], self.timestamps[i].item(), None, extra_attr))
+        return events
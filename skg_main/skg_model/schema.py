@@ -1,6 +1,11 @@
-from typing import Dict
+import calendar
+import json
+from datetime import timezone
+from typing import Dict, List, TYPE_CHECKING
 
-from neo4j.time import DateTime
+# neo4j is imported on first use: it accounts for most of the import time of skg_main.
+if TYPE_CHECKING:
+    from neo4j.time import DateTime
 
 
 class Timestamp:
@@ -23,10 +28,25 @@ class Timestamp:
         else:
             return str(self)
 
+    def to_epoch_millis(self):
+        # Timestamps carry no timezone: they are interpreted as UTC, as in to_datetime.
+        return calendar.timegm((self.year, self.month, self.day, self.hour, self.mins, self.sec)) * 1000
+
+    def to_datetime(self):
+        # Query parameter for date windows, whatever the schema's date_format (dates are compared as stored).
+        from neo4j.time import DateTime
+
+        return DateTime(self.year, self.month, self.day, self.hour, self.mins, self.sec, tzinfo=timezone.utc)
+
     @staticmethod
-    def parse_ts(dt: DateTime):
+    def parse_ts(dt: 'DateTime'):
         return Timestamp(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
 
+    @staticmethod
+    def epoch_millis(dt: 'DateTime'):
+        native = dt.to_native()
+        return calendar.timegm(native.utctimetuple()) * 1000 + native.microsecond // 1000
+
 
 class Event:
     def __init__(self, act: str, t: float, date: Timestamp = None, extra_attr: Dict[str, str] = {}):
@@ -60,6 +80,49 @@ class Event:
         return '{}, {}, {}, {}'.format(self.activity, self.timestamp, self.date, self.extra_attr)
 
 
+class EventCursor:
+    # Position in the event stream: the timestamp of the last returned event, and the element ids of the events
+    # returned so far with that timestamp. Events written later with the same timestamp are still returned,
+    # whatever their element id, since the whole boundary timestamp is read again and only these ids are skipped.
+    # A cursor without element ids points right before the first event with the given timestamp.
+    def __init__(self, timestamp=None, element_ids: List[str] = None):
+        self.timestamp = timestamp
+        self.element_ids = element_ids if element_ids is not None else []
+
+    def advance(self, timestamp, element_id: str):
+        if timestamp != self.timestamp:
+            self.timestamp = timestamp
+            self.element_ids = []
+        self.element_ids.append(element_id)
+
+    def __str__(self):
+        return '{}, {}'.format(self.timestamp, self.element_ids)
+
+    def save(self, path: str):
+        from neo4j.time import DateTime
+
+        if isinstance(self.timestamp, DateTime):
+            ts = {'datetime': self.timestamp.iso_format()}
+        else:
+            ts = self.timestamp
+        with open(path, 'w') as f:
+            json.dump({'timestamp': ts, 'element_ids': self.element_ids}, f)
+
+    @staticmethod
+    def load(path: str):
+        with open(path) as f:
+            cursor = json.load(f)
+        ts = cursor['timestamp']
+        if isinstance(ts, dict):
+            from neo4j.time import DateTime
+
+            ts = DateTime.from_iso_format(ts['datetime'])
+        if 'element_ids' in cursor:
+            return EventCursor(ts, cursor['element_ids'])
+        # Cursors saved with a single element id.
+        return EventCursor(ts, [cursor['element_id']] if cursor.get('element_id') is not None else [])
+
+
 class Entity:
     def __init__(self, _id, extra_attr: Dict[str, str]):
         self.entity_id = _id
@@ -14,9 +14,13 @@ class EntityRelationship:
 
 class EntityTree:
     def __init__(self, arcs: List[EntityRelationship]):
-        self.arcs = arcs
+        self.arcs: List[EntityRelationship] = []
         self.nodes: Dict[Entity, List[Entity]] = {}
-        for arc in self.arcs:
+        self.add_arcs(arcs)
+
+    def add_arcs(self, arcs: List[EntityRelationship]):
+        for arc in arcs:
+            self.arcs.append(arc)
             if arc.source in self.nodes:
                 self.nodes[arc.source].append(arc.target)
             else:
@@ -25,6 +29,13 @@ class EntityTree:
             if arc.target not in self.nodes:
                 self.nodes[arc.target] = []
 
+    def absorb(self, other):
+        # Incremental, in-place version of merge_trees (also keeps nodes that are not part of any arc).
+        self.add_arcs(other.arcs)
+        for node in other.nodes:
+            if node not in self.nodes:
+                self.nodes[node] = []
+
     @staticmethod
     def get_labels_hierarchy(arcs: Set[Tuple[str, str]]):
         # TODO: Requires further testing, probably does not support bifurcations.
@@ -84,9 +95,45 @@ class EntityTree:
         return EntityTree(t1.arcs + t2.arcs)
 
 
+class EntityDisjointSet:
+    # Union-find over entity ids, with union by size and path halving.
+    def __init__(self):
+        self.parents: Dict[str, str] = {}
+        self.sizes: Dict[str, int] = {}
+
+    def __contains__(self, entity_id):
+        return entity_id in self.parents
+
+    def find(self, entity_id):
+        if entity_id not in self.parents:
+            self.parents[entity_id] = entity_id
+            self.sizes[entity_id] = 1
+            return entity_id
+
+        while self.parents[entity_id] != entity_id:
+            self.parents[entity_id] = self.parents[self.parents[entity_id]]
+            entity_id = self.parents[entity_id]
+        return entity_id
+
+    def union(self, id1, id2):
+        root1, root2 = self.find(id1), self.find(id2)
+        if root1 == root2:
+            return root1
+        if self.sizes[root1] < self.sizes[root2]:
+            root1, root2 = root2, root1
+        self.parents[root2] = root1
+        self.sizes[root1] += self.sizes.pop(root2)
+        return root1
+
+
 class EntityForest:
     def __init__(self, trees: List[EntityTree]):
         self.trees = trees
+        self.components = EntityDisjointSet()
+        # Maps the root of each set of connected entity ids to the tree containing them.
+        self.trees_by_root: Dict[str, EntityTree] = {}
+        # Number of trees (in self.trees) already tracked by self.components.
+        self.indexed = 0
 
     def __getitem__(self, item):
         return self.trees[item]
@@ -98,16 +145,52 @@ class EntityForest:
                     return i, j
         return None
 
+    def merge(self, new_trees: List[EntityTree]):
+        absorbed: Set[int] = set()
+        for tree in new_trees:
+            entity_ids = [node.entity_id for node in tree.nodes]
+            if len(entity_ids) == 0:
+                self.trees.append(tree)
+                continue
+
+            roots = {self.components.find(e_id) for e_id in entity_ids if e_id in self.components}
+            overlapping = list({id(self.trees_by_root[r]): self.trees_by_root[r] for r in roots}.values())
+            if len(overlapping) == 0:
+                target = tree
+                self.trees.append(tree)
+            else:
+                # Smaller trees are merged into the largest one, so that each arc is copied O(log n) times.
+                target = max(overlapping, key=lambda t: len(t.arcs))
+                for other in overlapping + [tree]:
+                    if other is not target:
+                        LOGGER.debug('Merging trees with {} and {} arcs...', len(target.arcs), len(other.arcs))
+                        target.absorb(other)
+                        absorbed.add(id(other))
+
+            for r in roots:
+                self.trees_by_root.pop(r)
+            root = entity_ids[0]
+            for e_id in entity_ids:
+                root = self.components.union(root, e_id)
+            self.trees_by_root[root] = target
+
+        if len(absorbed) > 0:
+            self.trees = [t for t in self.trees if id(t) not in absorbed]
+        self.indexed = len(self.trees)
+
     def reduce(self):
-        tup = self.overlapping_trees()
-        while tup is not None:
-            i, j = tup[0], tup[1]
-            LOGGER.debug('Merging trees {} and {} of {}...'.format(i, j, len(self.trees)))
-            self.trees[i] = EntityTree.merge_trees(self.trees[i], self.trees[j])
-            self.trees.pop(j)
-            tup = self.overlapping_trees()
+        trees = self.trees
+        self.trees = []
+        self.components = EntityDisjointSet()
+        self.trees_by_root = {}
+        self.merge(trees)
 
     def add_trees(self, new_trees: List[EntityTree], reduce: bool = True):
-        self.trees.extend(new_trees)
-        if reduce:
+        if not reduce:
+            self.trees.extend(new_trees)
+        elif self.indexed != len(self.trees):
+            # Some trees were added without being reduced: rebuild the whole index.
+            self.trees.extend(new_trees)
             self.reduce()
+        else:
+            self.merge(new_trees)